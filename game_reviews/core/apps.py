@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import bans, page_cache, search
+
+        bans.connect_signals()
+        page_cache.connect_signals()
+        search.connect_signals()
+        post_migrate.connect(search.setup_search_backend, sender=self)
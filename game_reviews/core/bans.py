@@ -0,0 +1,81 @@
+"""
+Bans.
+
+Banning a user deletes every session they logged in with. The session keys are
+recorded in the database (UserSession) rather than the cache, so concurrent
+logins or cache evictions cannot lose one, and a ban made on one worker reaches
+sessions created on any other.
+
+BanMiddleware also logs out banned users, from a cached ban state. That cache
+has to be shared between workers: with a per-process cache such as the default
+LocMemCache, the workers that did not handle the ban keep their cached state for
+up to BAN_CACHE_TTL (and a cache based SESSION_ENGINE would not survive either).
+"""
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.core.cache import cache
+from django.db.models.signals import post_save
+
+from .models import CustomUser, UserSession
+
+
+def _ban_key(user_id):
+    return f"banned:{user_id}"
+
+
+def is_banned(user_id):
+    """
+    Returns whether the user is banned, reading the database only when the
+    user's ban state is not cached yet.
+    """
+    banned = cache.get(_ban_key(user_id))
+    if banned is None:
+        banned = CustomUser.objects.filter(id=user_id, banned=True).exists()
+        cache.set(_ban_key(user_id), banned, settings.BAN_CACHE_TTL)
+    return banned
+
+
+def revoke_sessions(user):
+    """
+    Deletes every session the user logged in with, so they are logged out everywhere.
+    """
+    session_store = import_module(settings.SESSION_ENGINE).SessionStore
+    sessions = UserSession.objects.filter(user=user)
+    for session_key in sessions.values_list('session_key', flat=True):
+        session_store(session_key).delete()
+    sessions.delete()
+
+
+def ban(user):
+    """
+    Bans the user and ends their active sessions.
+    """
+    user.banned = True
+    user.save(update_fields=['banned'])
+    revoke_sessions(user)
+
+
+def update_ban_state(sender, instance, **kwargs):
+    cache.set(_ban_key(instance.pk), instance.banned, settings.BAN_CACHE_TTL)
+
+
+def remember_session(sender, request, user, **kwargs):
+    # Track the user's session keys so a ban can delete them; a single INSERT, so concurrent logins keep both
+    if request is None or not request.session.session_key:
+        return
+    UserSession.objects.bulk_create(
+        [UserSession(user=user, session_key=request.session.session_key)], ignore_conflicts=True
+    )
+
+
+def forget_session(sender, request, user, **kwargs):
+    if request is not None and request.session.session_key:
+        UserSession.objects.filter(session_key=request.session.session_key).delete()
+
+
+def connect_signals():
+    post_save.connect(update_ban_state, sender=CustomUser, dispatch_uid='bans_update_state')
+    user_logged_in.connect(remember_session, dispatch_uid='bans_remember_session')
+    user_logged_out.connect(forget_session, dispatch_uid='bans_forget_session')
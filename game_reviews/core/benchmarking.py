@@ -0,0 +1,166 @@
+"""
+Helpers for the benchmark management commands: a local stand-in for the SteamSpy
+and Steam APIs, offline settings overrides and latency/query measurement.
+"""
+import json
+import math
+import re
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        if self.path.startswith('/api.php'):
+            # SteamSpy appdetails
+            body = {'positive': 1200, 'negative': 300}
+        elif re.match(r'^/appreviews/\d+', self.path):
+            # A single page of Steam reviews
+            body = {
+                'success': 1,
+                'cursor': 'end',
+                'reviews': [
+                    {'recommendationid': str(i), 'review': f'Stub Steam review {i}'} for i in range(20)
+                ],
+            }
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@contextmanager
+def stub_steam_server(delay=0.0):
+    """
+    Runs a local HTTP server answering SteamSpy and Steam review requests, with an
+    optional artificial delay per request. Yields its base URL.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubHandler)
+    server.delay = delay
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def offline_services(delay=0.0):
+    """
+    Points SteamSpy and Steam at the local stub server and media storage at the
+    local filesystem backend in a temporary directory, so benchmarks never leave
+    the machine.
+    """
+    with stub_steam_server(delay) as base_url, tempfile.TemporaryDirectory() as media_root:
+        backend = 'game_reviews.local_storage.LocalMediaFileStorage'  # Has upload(), unlike InMemoryStorage
+        with override_settings(
+            STEAMSPY_API_URL=f"{base_url}/api.php",
+            STEAM_STORE_URL=base_url,
+            STORAGES={
+                'default': {'BACKEND': backend},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+            # settings.py picks the backend with DEFAULT_FILE_STORAGE, which Django prefers over STORAGES
+            DEFAULT_FILE_STORAGE=backend,
+            MEDIA_ROOT=media_root,
+            MEDIA_URL='/media/',
+        ):
+            yield base_url
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def measure(request, iterations, warmup=0, before=None):
+    """
+    Calls request() (which returns a response) repeatedly and returns latency
+    percentiles in milliseconds, the median query count and response size.
+    Queries are counted on every database alias, since reads may go to replicas;
+    'queries' is the total and 'queries_by_alias' the median per alias.
+    before(), if given, runs ahead of every request, untimed and uncounted.
+    """
+    for _ in range(warmup):
+        if before:
+            before()
+        request()
+
+    aliases = list(connections)
+    timings, query_counts, sizes, statuses = [], {alias: [] for alias in aliases}, [], set()
+    for _ in range(iterations):
+        if before:
+            before()
+        with ExitStack() as stack:
+            captured = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases}
+            start = time.perf_counter()
+            response = request()
+            timings.append((time.perf_counter() - start) * 1000)
+        for alias, queries in captured.items():
+            query_counts[alias].append(len(queries.captured_queries))
+        sizes.append(len(response.content))
+        statuses.add(response.status_code)
+
+    totals = [sum(counts) for counts in zip(*query_counts.values())]
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'queries': statistics.median(totals),
+        'queries_by_alias': {alias: statistics.median(counts) for alias, counts in query_counts.items()},
+        'bytes': statistics.median(sizes),
+        'status': sorted(statuses),
+        'iterations': iterations,
+    }
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Returns a list of human readable regressions of current against baseline:
+    p95 latency more than threshold (a fraction) slower, or more queries.
+    """
+    regressions = []
+    for name, result in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if before['p95_ms'] and result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+    return regressions
+
+
+def git_commit():
+    """
+    Short hash of the checked out commit, stored with benchmark results.
+    """
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
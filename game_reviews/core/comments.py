@@ -0,0 +1,155 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Window
+from django.db.models.functions import Coalesce
+from django.db.models.functions import RowNumber
+
+from .models import Comment, Like
+from .page_cache import bump_versions
+from .pagination import CursorPaginator, paginate
+
+DEFAULT_COMMENTS_PER_PAGE = 5
+MAX_COMMENTS_PER_PAGE = 20
+REPLIES_PER_COMMENT = 3
+REPLIES_PER_PAGE = 10  # Replies per "load more replies" request
+REPLY_ORDERING = ('created', 'id')
+
+
+def parse_comments_per_page(value):
+    """
+    Parses the user supplied comments_per_page, clamped to 1..MAX_COMMENTS_PER_PAGE.
+    """
+    try:
+        per_page = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_COMMENTS_PER_PAGE
+    return max(1, min(per_page, MAX_COMMENTS_PER_PAGE))
+
+
+def load_comment_tree(request, game, per_page, replies_per_comment=REPLIES_PER_COMMENT):
+    """
+    Loads one page of a game's top-level comments together with the first replies
+    of each comment and the ids of the comments the user liked.
+
+    Returns (comments_page, replies_by_parent, liked_comment_ids). Comments with
+    more replies than shown get a replies_cursor for comment_replies. The number
+    of queries does not depend on the page size: one SELECT for the page (plus a
+    COUNT in offset mode), one SELECT for all replies and one for the user's likes.
+    """
+    top_level_comments = (
+        Comment.objects.filter(game=game, parent__isnull=True)
+        .select_related('user')
+    )
+    comments = paginate(request, top_level_comments, per_page, ('created', 'id'))
+    comments.object_list = list(comments.object_list)
+
+    parent_ids = [comment.id for comment in comments]
+    replies_by_parent = {parent_id: [] for parent_id in parent_ids}
+    if parent_ids:
+        # Number the replies within each parent and keep only the first few
+        replies = (
+            Comment.objects.filter(parent_id__in=parent_ids)
+            .select_related('user')
+            .annotate(
+                position=Window(
+                    RowNumber(),
+                    partition_by=[F('parent_id')],
+                    order_by=[F('created').asc(), F('id').asc()],
+                ),
+            )
+            # One extra reply tells whether there are more to load
+            .filter(position__lte=replies_per_comment + 1)
+            .order_by('parent_id', 'position')
+        )
+        for reply in replies:
+            replies_by_parent[reply.parent_id].append(reply)
+
+        reply_paginator = CursorPaginator(Comment.objects.all(), REPLIES_PER_PAGE, REPLY_ORDERING)
+        for comment in comments:
+            shown = replies_by_parent[comment.id]
+            comment.replies_cursor = None
+            if len(shown) > replies_per_comment:
+                del shown[replies_per_comment:]
+                comment.replies_cursor = reply_paginator.encode_cursor('next', shown[-1])
+
+    liked_comment_ids = set()
+    user = request.user
+    if user.is_authenticated and parent_ids:
+        comment_ids = parent_ids + [reply.id for replies in replies_by_parent.values() for reply in replies]
+        liked_comment_ids = set(
+            Like.objects.filter(user=user, comment_id__in=comment_ids).values_list('comment_id', flat=True)
+        )
+
+    return comments, replies_by_parent, liked_comment_ids
+
+
+def load_replies(request, comment, per_page=REPLIES_PER_PAGE):
+    """
+    Loads the page of the comment's replies after the ?cursor the request carries
+    and the ids of the ones the user liked. Returns (replies_page, liked_comment_ids).
+    """
+    replies = Comment.objects.filter(parent=comment).select_related('user')
+    page = CursorPaginator(replies, per_page, REPLY_ORDERING).get_page(request.GET.get('cursor'))
+
+    liked_comment_ids = set()
+    if request.user.is_authenticated and page.object_list:
+        liked_comment_ids = set(
+            Like.objects.filter(user=request.user, comment__in=page.object_list).values_list('comment_id', flat=True)
+        )
+    return page, liked_comment_ids
+
+
+def toggle_like(user, comment):
+    """
+    Likes the comment for the user, or removes the like if it already exists.
+
+    The Like row and Comment.like_count change in the same transaction and the
+    unique (user, comment) constraint makes a concurrent duplicate insert a no-op,
+    so double clicks can never inflate the count. Like has no signal handlers, so
+    the delete is a single DELETE; the cached pages of the game are invalidated
+    here instead. Returns (liked, like_count).
+    """
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(user=user, comment=comment).delete()
+        if deleted:
+            liked, delta = False, -1
+        else:
+            try:
+                with transaction.atomic():
+                    Like.objects.create(user=user, comment=comment)
+                liked, delta = True, 1
+            except IntegrityError:
+                # Another request inserted the same like first, ignore this one
+                liked, delta = True, 0
+
+        if delta:
+            Comment.objects.filter(id=comment.id).update(like_count=F('like_count') + delta)
+            bump_versions(f"game:{comment.game_id}")
+        like_count = Comment.objects.values_list('like_count', flat=True).get(id=comment.id)
+
+    return liked, like_count
+
+
+def actual_like_count():
+    """
+    Expression counting a comment's Like rows, for set-based recomputation of like_count.
+    """
+    return Coalesce(
+        Subquery(
+            Like.objects.filter(comment=OuterRef('pk'))
+            .order_by()
+            .values('comment')
+            .annotate(total=Count('id'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def recompute_like_counts(comments=None):
+    """
+    Resets like_count to the real number of likes with a single UPDATE, touching
+    only the comments whose stored count is wrong. Returns how many were fixed.
+    """
+    comments = Comment.objects.all() if comments is None else comments
+    drifted = comments.annotate(actual_count=actual_like_count()).exclude(like_count=F('actual_count'))
+    return Comment.objects.filter(id__in=drifted.values('id')).update(like_count=actual_like_count())
@@ -1,13 +1,20 @@
+import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from django import forms
-from google.cloud import storage
 from django.conf import settings
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
+from django.core.files.storage import default_storage
 from django.utils.text import slugify
 
+from .image_derivatives import derivative_uploads
+from .instrumentation import timed
 from .models import CustomUser, Game, Comment, Review
+from .thumbnails import render_thumbnails
+
+logger = logging.getLogger(__name__)
 
 
 class CustomUserCreationForm(UserCreationForm):
@@ -36,31 +43,27 @@ class CustomAuthenticationForm(AuthenticationForm):
 
 
 class GameForm(forms.ModelForm):
+    IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
+    VIDEO_EXTENSIONS = ['.mp4', '.webm', '.mov']
+    # Uploaded file fields: (folder in the bucket, allowed extensions or None for any)
+    UPLOAD_FIELDS = {
+        'image': ('images', IMAGE_EXTENSIONS),
+        'video': ('videos', VIDEO_EXTENSIONS),
+        'file': ('files', None),
+    }
 
     def upload_file(self, file, content_type, blob_name):
         try:
-            # Initialize storage client
-            storage_client = storage.Client(credentials=settings.GS_CREDENTIALS)
-            bucket = storage_client.get_bucket(settings.GS_BUCKET_NAME)
-            blob = bucket.blob(blob_name)
-
-            # Read and upload the file content
-            content = file.read()
-            blob.upload_from_string(content, content_type=content_type)
-
-            # Make the file publicly accessible
-            blob.make_public()
-            return blob.public_url
+            return default_storage.upload(file, blob_name, content_type)
         except Exception as e:
             raise ValueError(f"Error uploading file: {e}")
 
-    def gen_filename(self, filename):
+    def gen_filename(self, filename, allowed_extensions=IMAGE_EXTENSIONS):
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         ext = os.path.splitext(filename)[1].lower()
 
         # Validate file extension
-        allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
-        if ext not in allowed_extensions:
+        if allowed_extensions is not None and ext not in allowed_extensions:
             raise ValueError("Invalid file extension")
 
         return f"{timestamp}{ext}"
@@ -68,36 +71,46 @@ class GameForm(forms.ModelForm):
     def save(self, commit=True):
         instance = super().save(commit=False)  # Create an instance without saving to the database
         try:
-            # Check if a new image is uploaded
-            if 'image' in self.cleaned_data:
-                image_file = self.cleaned_data['image']
-                # Only handle new image uploads
-                if hasattr(image_file, 'content_type'):  # Check if it's a new file
-                    dest_blob = f"{settings.GS_LOCATION}/games/images/{self.gen_filename(image_file.name)}"
-                    public_url = self.upload_file(image_file, image_file.content_type, dest_blob)
-                    instance.image = public_url  # Update with the new uploaded image URL
-
-            # Handle video and file fields similarly (if needed)
-            if 'video' in self.cleaned_data:
-                video_file = self.cleaned_data['video']
-                if hasattr(video_file, 'content_type'):
-                    dest_blob = f"{settings.GS_LOCATION}/games/videos/{self.gen_filename(video_file.name)}"
-                    public_url = self.upload_file(video_file, video_file.content_type, dest_blob)
-                    instance.video = public_url
-
-            if 'file' in self.cleaned_data:
-                file_file = self.cleaned_data['file']
-                if hasattr(file_file, 'content_type'):
-                    dest_blob = f"{settings.GS_LOCATION}/games/files/{self.gen_filename(file_file.name)}"
-                    public_url = self.upload_file(file_file, file_file.content_type, dest_blob)
-                    instance.file = public_url
+            # Only new uploads have a content type, unchanged fields hold the stored URL
+            uploads = {}
+            for field, (folder, allowed_extensions) in self.UPLOAD_FIELDS.items():
+                uploaded_file = self.cleaned_data.get(field)
+                if hasattr(uploaded_file, 'content_type'):
+                    filename = self.gen_filename(uploaded_file.name, allowed_extensions)
+                    uploads[field] = (uploaded_file, f"{settings.GS_LOCATION}/games/{folder}/{filename}")
+
+            # Thumbnails are rendered from the new image before it is uploaded
+            thumbnail_uploads = []
+            if 'image' in uploads:
+                uploaded_image, image_name = uploads['image']
+                try:
+                    thumbnail_uploads = derivative_uploads(image_name, render_thumbnails(uploaded_image))
+                except Exception as e:
+                    logger.exception("Could not create thumbnails of %s: %s", image_name, e)
+                instance.image_derivatives = {}
+
+            # Upload the image, video, file and thumbnails of the game in parallel
+            if uploads:
+                with timed('storage'), ThreadPoolExecutor(max_workers=settings.GS_UPLOAD_WORKERS) as pool:
+                    futures = {
+                        field: pool.submit(self.upload_file, uploaded_file, uploaded_file.content_type, blob_name)
+                        for field, (uploaded_file, blob_name) in uploads.items()
+                    }
+                    thumbnail_futures = [
+                        (format_name, width, pool.submit(self.upload_file, file, content_type, name))
+                        for format_name, width, file, name, content_type in thumbnail_uploads
+                    ]
+                    for field, future in futures.items():
+                        setattr(instance, field, future.result())  # Update with the uploaded file's URL or name
+                    for format_name, width, future in thumbnail_futures:
+                        instance.image_derivatives.setdefault(format_name, {})[str(width)] = future.result()
 
             # Save the instance
             if commit:
                 instance.save()
 
         except Exception as e:
-            print(f"ERROR: {e}")
+            logger.exception("Failed to save game: %s", e)
             raise ValueError(f"Failed to save game: {e}")
 
         return instance
@@ -0,0 +1,74 @@
+"""
+Thumbnails of game images, stored next to the original.
+
+A game image at uploads/games/images/20240101120000.png gets
+uploads/games/images/20240101120000_w320.webp and so on for every format and
+width of core.thumbnails. What the storage returned for each upload is kept in
+Game.image_derivatives, which templates turn into srcset attributes.
+"""
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .thumbnails import THUMBNAIL_FORMATS
+
+DOWNLOAD_TIMEOUT = 30  # Seconds to fetch an original image by URL
+
+
+def derivative_name(image_name, format_name, width):
+    stem = os.path.splitext(image_name)[0]
+    return f"{stem}_w{width}.{THUMBNAIL_FORMATS[format_name][1]}"
+
+
+def derivative_uploads(image_name, thumbnails):
+    """
+    Returns (format, width, file, name, content type) for each rendered thumbnail,
+    ready to be passed to default_storage.upload.
+    """
+    return [
+        (format_name, width, ContentFile(content), derivative_name(image_name, format_name, width),
+         THUMBNAIL_FORMATS[format_name][2])
+        for (format_name, width), content in thumbnails.items()
+    ]
+
+
+def store_derivatives(image_name, thumbnails):
+    """
+    Uploads rendered thumbnails next to the image and returns the value for
+    Game.image_derivatives.
+    """
+    derivatives = {}
+    for format_name, width, file, name, content_type in derivative_uploads(image_name, thumbnails):
+        derivatives.setdefault(format_name, {})[str(width)] = default_storage.upload(file, name, content_type)
+    return derivatives
+
+
+def storage_name(image):
+    """
+    Returns the storage name of a stored game image, which is the public URL
+    for images uploaded to Google Cloud Storage.
+    """
+    value = str(image)
+    if not urlparse(value).scheme:
+        return value
+    path = urlparse(value).path.lstrip('/')
+    bucket_prefix = f"{settings.GS_BUCKET_NAME}/"
+    return path[len(bucket_prefix):] if path.startswith(bucket_prefix) else path
+
+
+def read_image(image):
+    """
+    Returns the bytes of a stored game image.
+    """
+    value = str(image)
+    if urlparse(value).scheme:
+        import requests  # Imported on first use to keep worker start fast
+
+        response = requests.get(value, timeout=DOWNLOAD_TIMEOUT)
+        response.raise_for_status()
+        return response.content
+    with default_storage.open(value) as image_file:
+        return image_file.read()
@@ -0,0 +1,180 @@
+"""
+Lightweight per-request instrumentation.
+
+RequestMetricsMiddleware installs a RequestMetrics object for the duration of a
+request; code that talks to slow dependencies wraps the call in timed(), e.g.
+
+    with timed('http'):
+        requests.get(...)
+
+Outside a request (management commands, background threads) timed() is a no-op.
+Finished requests are folded into per-URL-name histograms kept in process memory.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+CATEGORIES = ('db', 'http', 'storage', 'template')
+# Upper bounds of the histogram buckets (the last bucket is open ended)
+BUCKET_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKET_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'seconds', 'counts', 'lock')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.seconds = dict.fromkeys(CATEGORIES, 0.0)
+        self.counts = dict.fromkeys(CATEGORIES, 0)
+        # Async views time work running in several threads at once
+        self.lock = threading.Lock()
+
+    def add(self, category, seconds):
+        with self.lock:
+            self.seconds[category] += seconds
+            self.counts[category] += 1
+
+    def server_timing(self, total_seconds):
+        """
+        Formats the metrics as a Server-Timing header value.
+        """
+        parts = [
+            f'{category};dur={self.seconds[category] * 1000:.1f};desc="{self.counts[category]} calls"'
+            for category in CATEGORIES if self.counts[category]
+        ]
+        parts.append(f'total;dur={total_seconds * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def start_request():
+    metrics = RequestMetrics()
+    return metrics, _current_metrics.set(metrics)
+
+
+def finish_request(token):
+    _current_metrics.reset(token)
+
+
+def current_metrics():
+    return _current_metrics.get()
+
+
+@contextmanager
+def timed(category):
+    """
+    Adds the time spent in the block to the current request's category.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(category, time.perf_counter() - start)
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    """
+    Database execute wrapper timing every query, see connection.execute_wrapper().
+    """
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def instrumented_connections():
+    """
+    Times the queries run on this thread's database connections inside the block.
+    """
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(sql_execute_wrapper))
+        yield
+
+
+class Histogram:
+    __slots__ = ('bounds', 'buckets', 'count', 'sum')
+
+    def __init__(self, bounds=BUCKET_BOUNDS_MS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def as_dict(self):
+        labels = [f'le_{bound}' for bound in self.bounds] + ['inf']
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'buckets': dict(zip(labels, self.buckets)),
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def record_request(url_name, metrics, total_seconds):
+    """
+    Folds a finished request into the histograms of its URL name.
+    """
+    with _histograms_lock:
+        histograms = _histograms.get(url_name)
+        if histograms is None:
+            histograms = _histograms[url_name] = {name: Histogram() for name in ('total',) + CATEGORIES}
+            histograms['queries'] = Histogram(QUERY_BUCKET_BOUNDS)
+        histograms['total'].observe(total_seconds * 1000)
+        for category in CATEGORIES:
+            histograms[category].observe(metrics.seconds[category] * 1000)
+        histograms['queries'].observe(metrics.counts['db'])
+
+
+def metrics_snapshot():
+    """
+    Returns the histograms of this worker process as plain data. Durations are
+    in milliseconds, 'queries' holds the number of SQL queries per request.
+    """
+    with _histograms_lock:
+        views = {
+            url_name: {name: histogram.as_dict() for name, histogram in histograms.items()}
+            for url_name, histograms in _histograms.items()
+        }
+    return {'pid': os.getpid(), 'views': views}
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing every top-level template render.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
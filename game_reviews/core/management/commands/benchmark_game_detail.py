@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import AsyncClient, override_settings
+from django.urls import include, path, reverse
+from core import views
+from core.benchmarking import offline_services, percentile
+from core.models import CustomUser, Game
+
+# Both versions of the view side by side, for override_settings(ROOT_URLCONF=__name__)
+urlpatterns = [
+    path('benchmark/sync/<int:game_id>/', views.game_detail, name='benchmark_game_detail_sync'),
+    path('benchmark/async/<int:game_id>/', views.game_detail_async, name='benchmark_game_detail_async'),
+    path('', include('core.urls')),
+]
+
+
+class Command(BaseCommand):
+    help = ('Compare latency and throughput of the sync and async game_detail views under the same '
+            'concurrent load, both served through the ASGI handler. The async view renders the SteamSpy '
+            'stats and latest reviews into the page, so for the same content a sync "request" is the '
+            'page followed by its Steam and reviews fragments, one after another.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--game', type=int, help='Game to request (default: the most commented game)')
+        parser.add_argument('--requests', type=int, default=100, help='Measured requests per view (default 100)')
+        parser.add_argument('--concurrency', type=int, default=10, help='Requests in flight at once (default 10)')
+
+    def handle(self, *args, **options):
+        games = Game.objects.annotate(comment_total=Count('comment')).order_by('-comment_total', 'id')
+        game = games.filter(id=options['game']).first() if options['game'] else games.first()
+        if game is None:
+            raise CommandError("No such game." if options['game'] else "The database has no games.")
+        # A critic exercises every part of the page, and logged-in requests bypass the page cache
+        user = CustomUser.objects.filter(role='critic').first() or CustomUser.objects.first()
+        if user is None:
+            raise CommandError("The benchmark needs at least one user.")
+
+        with offline_services(), override_settings(ROOT_URLCONF=__name__):
+            for mode in ('sync', 'async'):
+                result = asyncio.run(self._measure(mode, game, user, options))
+                self.stdout.write(
+                    f"{mode:<6} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                    f"throughput {result['throughput']:>7.1f} req/s  status {result['status']}"
+                )
+
+    async def _measure(self, mode, game, user, options):
+        client = AsyncClient(HTTP_HOST='localhost')
+        await client.aforce_login(user)
+        urls = [f"/benchmark/{mode}/{game.id}/"]
+        if mode == 'sync':
+            urls += [reverse('game_steam_fragment', args=[game.id]), reverse('game_reviews_fragment', args=[game.id])]
+        for url in urls:
+            await client.get(url)  # Warm up
+
+        timings, statuses = [], set()
+
+        async def worker(count):
+            for _ in range(count):
+                start = time.perf_counter()
+                for url in urls:
+                    response = await client.get(url)
+                    statuses.add(response.status_code)
+                timings.append((time.perf_counter() - start) * 1000)
+
+        concurrency = max(1, min(options['concurrency'], options['requests']))
+        shares = [options['requests'] // concurrency + (index < options['requests'] % concurrency)
+                  for index in range(concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(count) for count in shares))
+        elapsed = time.perf_counter() - start
+
+        return {
+            'p50_ms': percentile(timings, 0.5),
+            'p95_ms': percentile(timings, 0.95),
+            'throughput': len(timings) / elapsed,
+            'status': sorted(statuses),
+        }
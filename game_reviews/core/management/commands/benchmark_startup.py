@@ -0,0 +1,126 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarking import git_commit
+
+# Run in a fresh interpreter, as a worker would be started
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+settings_loaded = time.perf_counter()
+django.setup()
+setup_done = time.perf_counter()
+from django.test import Client
+status = Client(HTTP_HOST='localhost').get(sys.argv[1]).status_code
+first_response = time.perf_counter()
+print(json.dumps({
+    'settings_ms': (settings_loaded - start) * 1000,
+    'setup_ms': (setup_done - settings_loaded) * 1000,
+    'first_response_ms': (first_response - setup_done) * 1000,
+    'status': status,
+}))
+'''
+
+METRICS = ('wall_ms', 'import_ms', 'settings_ms', 'setup_ms', 'first_response_ms')
+
+
+class Command(BaseCommand):
+    help = ('Measure how long a new process takes to import the project, set up Django and answer '
+            'its first request, and which packages spend the most import time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Processes to start, the median is reported')
+        parser.add_argument('--path', default='/login/', help='URL of the first request (default /login/)')
+        parser.add_argument('--top', type=int, default=15, help='Packages to list by import time (default 15)')
+        parser.add_argument('--output', default='startup_results.json', help='Where to write the JSON results')
+        parser.add_argument('--compare', help='Earlier results file to check for regressions')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed slowdown against --compare, as a fraction (default 0.2)')
+
+    def handle(self, *args, **options):
+        runs = [self._start_process(options['path']) for _ in range(max(1, options['runs']))]
+        statuses = sorted({run['status'] for run in runs})
+        results = {metric: round(statistics.median(run[metric] for run in runs), 1) for metric in METRICS}
+        packages = {
+            package: round(statistics.median(run['packages'].get(package, 0) for run in runs), 1)
+            for package in set().union(*(run['packages'] for run in runs))
+        }
+
+        for metric in METRICS:
+            self.stdout.write(f"{metric:<18} {results[metric]:>9.1f}ms")
+        self.stdout.write(f"first response status {statuses}")
+        self.stdout.write("Slowest imports (self time, summed per top-level package):")
+        top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['top']]
+        for package, milliseconds in top:
+            self.stdout.write(f"  {package:<28} {milliseconds:>8.1f}ms")
+
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'path': options['path'],
+            'runs': len(runs),
+            'results': results,
+            'packages': dict(top),
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)['results']
+            regressions = [
+                f"{metric}: {baseline[metric]:.1f}ms -> {results[metric]:.1f}ms"
+                for metric in METRICS
+                if baseline.get(metric) and results[metric] > baseline[metric] * (1 + options['threshold'])
+            ]
+            if regressions:
+                raise CommandError("Regressions found:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+
+    def _start_process(self, path):
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            filter(None, [str(settings.BASE_DIR), os.environ.get('PYTHONPATH')])
+        ))
+        start = time.perf_counter()
+        child = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD, path],
+            cwd=settings.BASE_DIR, env=environment, capture_output=True, text=True,
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+        if child.returncode != 0:
+            raise CommandError(f"The measured process failed:\n{_without_importtime(child.stderr)}")
+
+        run = json.loads(child.stdout.strip().splitlines()[-1])
+        run['wall_ms'] = wall_ms
+        run['packages'] = _import_times(child.stderr)
+        run['import_ms'] = sum(run['packages'].values())
+        return run
+
+
+def _import_times(stderr):
+    """
+    Sums the self time of -X importtime lines per top-level package, in milliseconds.
+    """
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|', 2)
+        packages[name.strip().split('.')[0]] += int(self_us) / 1000
+    return packages
+
+
+def _without_importtime(stderr):
+    return '\n'.join(line for line in stderr.splitlines() if not line.startswith('import time:'))
@@ -0,0 +1,121 @@
+import itertools
+import json
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from core.benchmarking import compare_results, git_commit, measure, offline_services
+from core.models import Comment, CustomUser, Game, Review
+from core.page_cache import invalidate_all
+
+# Views behind the anonymous page cache, also measured served from it as <name>_cached
+PAGE_CACHED = {
+    'home', 'game_list', 'game_list_title_desc', 'game_list_top_rated', 'game_list_lowest_rated',
+    'game_list_search', 'game_list_search_sorted', 'game_detail', 'game_steam_fragment',
+    'game_reviews_fragment', 'comment_replies',
+}
+
+
+class Command(BaseCommand):
+    help = ('Measure p50/p95 latency, query count and response size of the hot views. The page cache '
+            'is emptied before every request, pages it serves are measured from it separately. '
+            'Runs against the configured database and modifies likes and votes, use a benchmark database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Measured requests per view')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per view first')
+        parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results')
+        parser.add_argument('--compare', help='Earlier results file to check for regressions')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed p95 slowdown against --compare, as a fraction (default 0.2)')
+        parser.add_argument('--seed-data', action='store_true',
+                            help='First generate a dataset with preload_data --scale')
+        parser.add_argument('--seed', type=int, default=42, help='Seed for --seed-data')
+        parser.add_argument('--games', type=int, default=5_000, help='Games for --seed-data')
+        parser.add_argument('--comments', type=int, default=200_000, help='Comments for --seed-data')
+
+    def handle(self, *args, **options):
+        if options['seed_data']:
+            call_command(
+                'preload_data', scale=True, seed=options['seed'], games=options['games'],
+                comments=options['comments'], reviews=options['comments'] // 5, likes=options['comments'],
+                votes=options['comments'] // 2, users=5_000, critics=500, stdout=self.stdout,
+            )
+
+        # The most commented game is the worst case for the detail and comment views
+        game = Game.objects.annotate(comment_total=Count('comment')).order_by('-comment_total', 'id').first()
+        if game is None:
+            raise CommandError("The database has no games, run with --seed-data.")
+        review = Review.objects.filter(game=game).first() or Review.objects.first()
+        comment = Comment.objects.filter(game=game, parent__isnull=True).first()
+        user = CustomUser.objects.filter(role='user').order_by('id').first()
+        if not (review and comment and user):
+            raise CommandError("The benchmark needs at least one review, comment and regular user.")
+
+        anonymous = Client(HTTP_HOST='localhost')
+        logged_in = Client(HTTP_HOST='localhost')
+        logged_in.force_login(user)
+        # Alternate vote directions, since repeating the same vote is rejected
+        vote_directions = itertools.cycle(['up', 'down'])
+
+        scenarios = {
+            'home': lambda: anonymous.get(reverse('home')),
+            'game_list': lambda: anonymous.get(reverse('game_list')),
+            'game_list_title_desc': lambda: anonymous.get(reverse('game_list'), {'sort': 'title', 'order': 'desc'}),
+            'game_list_top_rated': lambda: anonymous.get(
+                reverse('game_list'), {'sort': 'average_rating', 'order': 'desc'}),
+            'game_list_lowest_rated': lambda: anonymous.get(
+                reverse('game_list'), {'sort': 'average_rating', 'order': 'asc'}),
+            'game_list_search': lambda: anonymous.get(reverse('game_list'), {'q': game.title.split()[0]}),
+            'game_list_search_sorted': lambda: anonymous.get(
+                reverse('game_list'), {'q': game.title.split()[0], 'sort': 'title', 'order': 'asc'}),
+            'game_detail': lambda: anonymous.get(reverse('game_detail', args=[game.id])),
+            'game_detail_logged_in': lambda: logged_in.get(reverse('game_detail', args=[game.id])),
+            'game_steam_fragment': lambda: anonymous.get(reverse('game_steam_fragment', args=[game.id])),
+            'game_reviews_fragment': lambda: anonymous.get(reverse('game_reviews_fragment', args=[game.id])),
+            'comment_replies': lambda: anonymous.get(reverse('comment_replies', args=[game.id, comment.id])),
+            'all_reviews': lambda: anonymous.get(reverse('all_reviews', args=[game.id])),
+            'all_reviews_helpful': lambda: anonymous.get(reverse('all_reviews', args=[game.id]), {'sort': 'helpful'}),
+            'like_comment': lambda: logged_in.post(reverse('like_comment', args=[comment.id])),
+            'vote_review': lambda: logged_in.post(reverse('vote_review', args=[review.id, next(vote_directions)])),
+        }
+
+        results = {}
+        with offline_services():
+            cache.clear()
+            measured = [(name, request, invalidate_all) for name, request in scenarios.items()]
+            measured += [(f"{name}_cached", scenarios[name], None) for name in scenarios if name in PAGE_CACHED]
+            for name, request, before in measured:
+                # Emptying the page cache measures the view itself rather than a cache lookup
+                results[name] = measure(request, options['iterations'], options['warmup'], before)
+                self.stdout.write(
+                    f"{name:<33} p50 {results[name]['p50_ms']:>8.2f}ms  p95 {results[name]['p95_ms']:>8.2f}ms  "
+                    f"queries {results[name]['queries']:>5}  bytes {results[name]['bytes']:>8}  "
+                    f"status {results[name]['status']}"
+                    + (f"  per database {results[name]['queries_by_alias']}" if len(results[name]['queries_by_alias']) > 1 else '')
+                )
+
+        report = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'game_id': game.id,
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)['results']
+            regressions = compare_results(baseline, results, options['threshold'])
+            if regressions:
+                raise CommandError("Regressions found:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}"))
+
@@ -0,0 +1,59 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from core.models import Review, ReviewVote
+from core.page_cache import invalidate_all
+
+LEGACY_TABLE = 'core_review_voters'  # The table of Review.voters before it went through ReviewVote
+
+
+class Command(BaseCommand):
+    help = ('Copy the voters of the old Review.voters table into ReviewVote and recompute the vote counts. '
+            'Run it once ReviewVote exists and before the migration that drops the old table (or rename '
+            'that table first and pass --table). The old table did not record directions, so each '
+            "review's voters are split into up and down votes that add up to its helpful_votes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', default=LEGACY_TABLE, help=f'Table to copy from (default {LEGACY_TABLE})')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Reviews copied per transaction')
+
+    def handle(self, *args, **options):
+        table = options['table']
+        if table not in connection.introspection.table_names():
+            raise CommandError(f"There is no {table} table to copy votes from.")
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT review_id, customuser_id FROM {connection.ops.quote_name(table)} ORDER BY review_id, id"
+            )
+            rows = cursor.fetchall()
+
+        voters = {review_id: [user_id for _, user_id in group] for review_id, group in groupby(rows, lambda row: row[0])}
+        review_ids = list(voters)
+        copied = 0
+        for start in range(0, len(review_ids), options['batch_size']):
+            batch = review_ids[start:start + options['batch_size']]
+            net_votes = dict(Review.objects.filter(id__in=batch).values_list('id', 'helpful_votes'))
+            votes = []
+            for review_id in batch:
+                if review_id not in net_votes:
+                    continue
+                user_ids = voters[review_id]
+                # up - down = helpful_votes and up + down = number of voters, within what is possible
+                upvotes = min(max((len(user_ids) + (net_votes[review_id] or 0)) // 2, 0), len(user_ids))
+                votes += [
+                    ReviewVote(review_id=review_id, user_id=user_id,
+                               value=ReviewVote.UP if index < upvotes else ReviewVote.DOWN)
+                    for index, user_id in enumerate(user_ids)
+                ]
+            with transaction.atomic():
+                # Votes cast through ReviewVote meanwhile are kept
+                ReviewVote.objects.bulk_create(votes, ignore_conflicts=True)
+                Review.recompute_helpful_votes(Review.objects.filter(id__in=batch))
+            copied += len(votes)
+
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {copied} votes on {len(review_ids)} reviews from {table}, keeping votes already recorded"
+        ))
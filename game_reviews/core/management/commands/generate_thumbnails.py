@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from core.image_derivatives import read_image, storage_name, store_derivatives
+from core.models import Game
+from core.thumbnails import render_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Create the WebP and JPEG thumbnails of game images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes resizing images (default: number of CPUs)')
+        parser.add_argument('--all', action='store_true', help='Also recreate existing thumbnails')
+
+    def handle(self, *args, **options):
+        games = (
+            Game.objects.exclude(image='').exclude(image__isnull=True)
+            .only('id', 'image', 'image_derivatives', 'parent_game')
+        )
+        if not options['all']:
+            games = games.filter(image_derivatives={})
+
+        done = failed = 0
+        pending = {}
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            for game in games.iterator():
+                # Keep the workers busy without holding every original in memory
+                if len(pending) >= options['workers'] * 2:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        ok = self._store(pending.pop(future), future)
+                        done, failed = done + ok, failed + (not ok)
+                try:
+                    pending[pool.submit(render_thumbnails, read_image(game.image))] = game
+                except Exception as e:
+                    self.stderr.write(f"Game {game.id}: could not read {game.image}: {e}")
+                    failed += 1
+
+            for future in list(pending):
+                ok = self._store(pending.pop(future), future)
+                done, failed = done + ok, failed + (not ok)
+
+        self.stdout.write(self.style.SUCCESS(f"Created thumbnails for {done} games, {failed} failed"))
+
+    def _store(self, game, future):
+        try:
+            game.image_derivatives = store_derivatives(storage_name(game.image), future.result())
+        except Exception as e:
+            self.stderr.write(f"Game {game.id}: could not create thumbnails of {game.image}: {e}")
+            return False
+        # updated_at refreshes the cached game cards, the save signal the cached pages
+        game.save(update_fields=['image_derivatives', 'updated_at'])
+        return True
@@ -0,0 +1,31 @@
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Game
+from core.steam import import_steam_reviews
+
+
+class Command(BaseCommand):
+    help = 'Import Steam reviews as comments, updating reviews that were imported before'
+
+    def add_arguments(self, parser):
+        parser.add_argument('game_ids', nargs='*', type=int, help='Games to import (default: all with a Steam App ID)')
+        parser.add_argument('--max-pages', type=int, default=None, help='Stop after this many pages per game')
+        parser.add_argument('--batch-size', type=int, default=500, help='Comments written per INSERT')
+
+    def handle(self, *args, **options):
+        games = Game.objects.exclude(steam_app_id__isnull=True)
+        if options['game_ids']:
+            games = games.filter(id__in=options['game_ids'])
+            if not games.exists():
+                raise CommandError("None of the given games has a Steam App ID.")
+
+        session = requests.Session()
+        for game in games.order_by('id'):
+            try:
+                imported_count = import_steam_reviews(
+                    game, max_pages=options['max_pages'], batch_size=options['batch_size'], session=session
+                )
+            except requests.RequestException as e:
+                self.stderr.write(self.style.ERROR(f"Failed to fetch Steam reviews for '{game.title}': {e}"))
+                continue
+            self.stdout.write(self.style.SUCCESS(f"Imported {imported_count} reviews for '{game.title}'"))
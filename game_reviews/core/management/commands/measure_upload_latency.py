@@ -0,0 +1,96 @@
+import io
+import os
+import statistics
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from game_reviews.gcloud import PUBLISH_BATCH_SIZE, get_bucket, get_client, publish_blobs, upload_file
+
+
+class Command(BaseCommand):
+    help = ('Measure the latency of public uploads to the bucket: upload followed by make_public, '
+            'upload with a predefined ACL, and uploads published afterwards in batches')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=20, help='Files uploaded per mode (default 20)')
+        parser.add_argument('--size', type=int, default=64, help='File size in KB (default 64)')
+
+    def handle(self, *args, **options):
+        if settings.STORAGE_BACKEND != 'gcs':
+            raise CommandError("Uploads are only measured with STORAGE_BACKEND=gcs.")
+        self.prefix = f"{settings.GS_LOCATION}/latency-test/{uuid.uuid4().hex}"
+        self.content = os.urandom(options['size'] * 1024)
+        self.uploaded = []
+
+        try:
+            for mode, measure in (('upload + make_public', self._make_public),
+                                  ('predefined ACL', self._predefined_acl),
+                                  ('batch publish', self._batch_publish)):
+                try:
+                    timings = measure(options['files'])
+                except Exception as e:
+                    self.stdout.write(self.style.WARNING(f"{mode:<22} failed: {e}"))
+                    continue
+                timings.sort()
+                self.stdout.write(
+                    f"{mode:<22} per file: mean {statistics.mean(timings):>7.1f}ms  "
+                    f"p50 {timings[len(timings) // 2]:>7.1f}ms  p95 {timings[int(len(timings) * 0.95)]:>7.1f}ms  "
+                    f"total {sum(timings):>8.1f}ms"
+                )
+        finally:
+            removed = self._remove_test_files()
+
+        self.stdout.write(self.style.SUCCESS(f"Uploaded and removed {removed} test files"))
+
+    def _remove_test_files(self):
+        # Listed by prefix, which also finds files whose upload finished just as a mode failed
+        blob_names = sorted(
+            set(self.uploaded) | {blob.name for blob in get_bucket().list_blobs(prefix=f"{self.prefix}/")}
+        )
+        # Google Cloud Storage rejects batches of more than 100 calls
+        for start in range(0, len(blob_names), PUBLISH_BATCH_SIZE):
+            with get_client().batch():
+                for blob_name in blob_names[start:start + PUBLISH_BATCH_SIZE]:
+                    get_bucket().blob(blob_name).delete()
+        return len(blob_names)
+
+    def _upload(self, mode, index, acl):
+        blob_name = f"{self.prefix}/{mode}-{index}.bin"
+        blob = get_bucket().blob(blob_name)
+        blob.upload_from_file(io.BytesIO(self.content), content_type='application/octet-stream',
+                              size=len(self.content), predefined_acl=acl)
+        self.uploaded.append(blob_name)
+        return blob
+
+    def _make_public(self, count):
+        timings = []
+        for index in range(count):
+            start = time.perf_counter()
+            self._upload('make-public', index, None).make_public()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def _predefined_acl(self, count):
+        timings = []
+        for index in range(count):
+            file = io.BytesIO(self.content)
+            file.size = len(self.content)
+            start = time.perf_counter()
+            upload_file(file, f"{self.prefix}/predefined-{index}.bin", 'application/octet-stream')
+            self.uploaded.append(f"{self.prefix}/predefined-{index}.bin")
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def _batch_publish(self, count):
+        timings, blob_names = [], []
+        for index in range(count):
+            start = time.perf_counter()
+            blob_names.append(self._upload('batch', index, None).name)
+            timings.append((time.perf_counter() - start) * 1000)
+        # One batch request publishes up to PUBLISH_BATCH_SIZE files, its cost is shared by them
+        start = time.perf_counter()
+        publish_blobs(blob_names)
+        share = (time.perf_counter() - start) * 1000 / count
+        return [timing + share for timing in timings]
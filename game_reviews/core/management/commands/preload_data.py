@@ -1,12 +1,38 @@
+import datetime
 import random
-from django.core.management.base import BaseCommand
-from core.models import CustomUser, Game, Platform, Category, Tag, Review
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.comments import recompute_like_counts
+from core.models import CustomUser, Game, Platform, Category, Tag, Review, Comment, Like, ReviewVote, \
+    GameTag, GameCategory, GamePlatform
+from core.page_cache import invalidate_all
+from core.search import rebuild_index
 from django.utils.timezone import now
 
+SYNTHETIC_PREFIX = 'synthetic'
+
+
 class Command(BaseCommand):
     help = 'Preload initial data into the database'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', action='store_true',
+                            help='Generate a large synthetic dataset for load testing instead')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, the same seed gives the same data')
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--critics', type=int, default=2_000)
+        parser.add_argument('--games', type=int, default=100_000)
+        parser.add_argument('--comments', type=int, default=5_000_000)
+        parser.add_argument('--reviews', type=int, default=1_000_000)
+        parser.add_argument('--likes', type=int, default=5_000_000)
+        parser.add_argument('--votes', type=int, default=2_000_000)
+        parser.add_argument('--batch-size', type=int, default=5_000, help='Rows per INSERT')
+
     def handle(self, *args, **kwargs):
+        if kwargs.get('scale'):
+            return self.handle_scale(**kwargs)
+
         # Create admin user
         admin_user, created = CustomUser.objects.get_or_create(
             username='admin',
@@ -169,3 +195,227 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS('Random reviews added (by critics only)'))
         self.stdout.write(self.style.SUCCESS('Initial data preloaded'))
+
+    def handle_scale(self, **options):
+        """
+        Generates a synthetic dataset with popularity skewed towards a few games.
+
+        Rows are written with bulk_create in large batches, which sends no model
+        signals, so the per-row rating, like count and search index maintenance
+        is skipped. Those aggregates are fixed up set-based once everything is in.
+        """
+        if CustomUser.objects.filter(username__startswith=f'{SYNTHETIC_PREFIX}_').exists():
+            raise CommandError("Synthetic data is already present, use a fresh database.")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        user_ids, critic_ids = self.generate_users(options['users'], options['critics'])
+        game_ids = self.generate_games(options['games'])
+        # Zipf-like popularity: the n-th game is picked with weight 1 / n^1.1
+        self.popularity = [1 / rank ** 1.1 for rank in range(1, len(game_ids) + 1)]
+
+        self.generate_reviews(game_ids, critic_ids, options['reviews'])
+        self.generate_comments(game_ids, user_ids, options['comments'])
+        self.generate_likes(user_ids, options['likes'], options['comments'])
+        self.generate_votes(user_ids, options['votes'], options['reviews'])
+
+        self.stdout.write('Fixing up aggregates...')
+        Game.recompute_rating_aggregates()
+        recompute_like_counts()
+        Review.recompute_helpful_votes()
+        rebuild_index()
+        invalidate_all()  # Bulk inserts send no signals
+        self.stdout.write(self.style.SUCCESS('Synthetic dataset generated'))
+
+    def bulk_insert(self, model, rows, **kwargs):
+        """
+        Inserts rows from an iterable in batches of batch_size, one transaction per batch.
+        """
+        inserted = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch, **kwargs)
+                inserted += len(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+            inserted += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"{inserted} {model._meta.verbose_name_plural} added"))
+
+    def pick_games(self, game_ids, count, limit=None):
+        """
+        Distributes count items over the games according to their popularity.
+        With a limit, no game gets more than limit items: what a game would get
+        beyond it goes to the games that still have room, again by popularity.
+        """
+        per_game = [0] * len(game_ids)
+        if limit is not None and count > limit * len(game_ids):
+            self.stdout.write(self.style.WARNING(
+                f"Only {limit * len(game_ids)} of {count} fit at {limit} per game"
+            ))
+            count = limit * len(game_ids)
+        candidates, weights = range(len(game_ids)), self.popularity
+        remaining = count
+        while remaining > 0:
+            chunk = min(remaining, 1_000_000)
+            for index in self.rng.choices(candidates, weights=weights, k=chunk):
+                per_game[index] += 1
+            remaining -= chunk
+            if limit is not None:
+                overflow = sum(max(0, picked - limit) for picked in per_game)
+                if overflow:
+                    per_game = [min(picked, limit) for picked in per_game]
+                    candidates = [index for index, picked in enumerate(per_game) if picked < limit]
+                    weights = [self.popularity[index] for index in candidates]
+                    remaining += overflow
+        return per_game
+
+    def heavy_tailed_count(self, mean, limit):
+        # Pareto tail with the given mean: most rows get 0-1, a few get very many.
+        # Adding a uniform [0, 1) before truncating keeps the mean unbiased.
+        if mean <= 0:
+            return 0
+        alpha = 1 + 1 / mean
+        return min(int(self.rng.paretovariate(alpha) - 1 + self.rng.random()), limit)
+
+    def generate_users(self, user_count, critic_count):
+        password = make_password('loadtestpassword')
+        self.bulk_insert(CustomUser, (
+            CustomUser(
+                username=f'{SYNTHETIC_PREFIX}_user{i}',
+                email=f'{SYNTHETIC_PREFIX}_user{i}@example.com',
+                password=password,
+                role='critic' if i < critic_count else 'user',
+            )
+            for i in range(user_count)
+        ))
+        users = CustomUser.objects.filter(username__startswith=f'{SYNTHETIC_PREFIX}_').order_by('id')
+        user_ids = list(users.values_list('id', flat=True))
+        critic_ids = list(users.filter(role='critic').values_list('id', flat=True))
+        return user_ids, critic_ids
+
+    def generate_games(self, game_count):
+        rng = self.rng
+        genres = ['Action', 'Adventure', 'RPG', 'Strategy', 'Simulation', 'Puzzle', 'Racing', 'Sports', 'Horror']
+        words = ['Dark', 'Star', 'Lost', 'Iron', 'Shadow', 'Crystal', 'Eternal', 'Silent', 'Wild', 'Last',
+                 'Kingdom', 'Legends', 'Quest', 'Tactics', 'Frontier', 'Odyssey', 'Rising', 'Chronicles']
+        first_release = datetime.date(2000, 1, 1)
+
+        self.bulk_insert(Game, (
+            Game(
+                title=f"{SYNTHETIC_PREFIX.title()} {rng.choice(words)} {rng.choice(words)} {i}",
+                description=' '.join(rng.choice(words).lower() for _ in range(30)),
+                developer=f'Dev Studio {rng.randrange(2000)}',
+                publisher=f'Publisher {rng.randrange(500)}',
+                release_date=first_release + datetime.timedelta(days=rng.randrange(9000)),
+                age_rating=rng.choice([3, 7, 12, 16, 18]),
+                genre=rng.choice(genres),
+                hidden=rng.random() < 0.01,
+            )
+            for i in range(game_count)
+        ))
+        game_ids = list(
+            Game.objects.filter(title__startswith=SYNTHETIC_PREFIX.title()).order_by('id').values_list('id', flat=True)
+        )
+
+        # Link every game to some tags, a category and platforms
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if len(tag_ids) < 50:
+            Tag.objects.bulk_create([Tag(tag_name=f'Tag {i}') for i in range(50 - len(tag_ids))])
+            tag_ids = list(Tag.objects.values_list('id', flat=True))
+        category_ids = list(Category.objects.values_list('id', flat=True)) or \
+            [Category.objects.create(category_name=genre).id for genre in genres]
+        platform_ids = list(Platform.objects.values_list('id', flat=True)) or \
+            [Platform.objects.create(platform_name=name).id for name in ['PC', 'PlayStation', 'Xbox', 'Nintendo']]
+
+        self.bulk_insert(GameTag, (
+            GameTag(game_id=game_id, tag_id=tag_id)
+            for game_id in game_ids for tag_id in rng.sample(tag_ids, rng.randint(1, 3))
+        ))
+        self.bulk_insert(GameCategory, (
+            GameCategory(game_id=game_id, category_id=rng.choice(category_ids)) for game_id in game_ids
+        ))
+        self.bulk_insert(GamePlatform, (
+            GamePlatform(game_id=game_id, platform_id=platform_id)
+            for game_id in game_ids for platform_id in rng.sample(platform_ids, rng.randint(1, 2))
+        ))
+        return game_ids
+
+    def generate_reviews(self, game_ids, critic_ids, review_count):
+        rng = self.rng
+        # At most one review per critic and game
+        per_game = self.pick_games(game_ids, review_count, limit=len(critic_ids))
+        self.bulk_insert(Review, (
+            Review(
+                game_id=game_id,
+                user_id=critic_id,
+                rating=rng.choices([1, 2, 3, 4, 5], weights=[1, 2, 4, 6, 4])[0],
+                title=f'Review of game {game_id}',
+                comment='Synthetic review text for load testing.',
+            )
+            for game_id, count in zip(game_ids, per_game) if count
+            for critic_id in rng.sample(critic_ids, count)
+        ))
+
+    def generate_comments(self, game_ids, user_ids, comment_count):
+        rng = self.rng
+        per_game = self.pick_games(game_ids, comment_count)
+        parents, replies = [], []
+
+        def flush():
+            # Parents first, so their ids are known when the replies are inserted.
+            # A reply's parent may also have gone in with an earlier batch.
+            with transaction.atomic():
+                Comment.objects.bulk_create(parents)
+                for reply in replies:
+                    reply.parent_id = reply.parent.id
+                Comment.objects.bulk_create(replies)
+            return len(parents) + len(replies)
+
+        inserted = 0
+        for game_id, count in zip(game_ids, per_game):
+            top_level = []  # This game's comments replies can answer
+            for _ in range(count):
+                comment = Comment(game_id=game_id, user_id=rng.choice(user_ids),
+                                  comment='Synthetic comment text for load testing.')
+                # Roughly a third of the comments are replies to an earlier comment of the game
+                if top_level and rng.random() < 0.3:
+                    comment.parent = rng.choice(top_level)
+                    replies.append(comment)
+                else:
+                    top_level.append(comment)
+                    parents.append(comment)
+                if len(parents) + len(replies) >= self.batch_size:
+                    inserted += flush()
+                    parents, replies = [], []
+        if parents or replies:
+            inserted += flush()
+        self.stdout.write(self.style.SUCCESS(f"{inserted} comments added"))
+
+    def generate_likes(self, user_ids, like_count, comment_count):
+        rng = self.rng
+        mean = like_count / comment_count if comment_count else 0
+        comment_ids = Comment.objects.filter(user__username__startswith=f'{SYNTHETIC_PREFIX}_') \
+            .order_by('id').values_list('id', flat=True).iterator(chunk_size=self.batch_size)
+        self.bulk_insert(Like, (
+            Like(comment_id=comment_id, user_id=user_id)
+            for comment_id in comment_ids
+            for user_id in rng.sample(user_ids, self.heavy_tailed_count(mean, len(user_ids)))
+        ), ignore_conflicts=True)
+
+    def generate_votes(self, user_ids, vote_count, review_count):
+        rng = self.rng
+        mean = vote_count / review_count if review_count else 0
+        review_ids = Review.objects.filter(user__username__startswith=f'{SYNTHETIC_PREFIX}_') \
+            .order_by('id').values_list('id', flat=True).iterator(chunk_size=self.batch_size)
+        self.bulk_insert(ReviewVote, (
+            ReviewVote(review_id=review_id, user_id=user_id,
+                       value=ReviewVote.UP if rng.random() < 0.7 else ReviewVote.DOWN)
+            for review_id in review_ids
+            for user_id in rng.sample(user_ids, self.heavy_tailed_count(mean, len(user_ids)))
+        ), ignore_conflicts=True)
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from core.ocr_jobs import process_stale_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run OCR verification jobs that were left pending or unfinished, e.g. by a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=10,
+                            help='Minutes without progress after which a job is picked up (default 10)')
+
+    def handle(self, *args, **options):
+        done, failed = process_stale_jobs(timedelta(minutes=options['stale_after']))
+        self.stdout.write(self.style.SUCCESS(f"Processed {done + failed} OCR jobs: {done} done, {failed} failed"))
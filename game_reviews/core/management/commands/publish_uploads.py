@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from game_reviews.gcloud import get_client, publish_blobs
+
+
+class Command(BaseCommand):
+    help = 'Make uploaded files public in batches, e.g. files uploaded before GS_DEFAULT_ACL was set'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default=f"{settings.GS_LOCATION}/",
+                            help='Only publish blobs whose name starts with this (default: the uploads folder)')
+
+    def handle(self, *args, **options):
+        if settings.STORAGE_BACKEND != 'gcs':
+            raise CommandError("Only files in Google Cloud Storage can be published.")
+        if settings.GS_DEFAULT_ACL is None:
+            raise CommandError("GS_DEFAULT_ACL is empty: the bucket uses uniform bucket-level access, "
+                               "grant public access on the bucket instead.")
+
+        blobs = get_client().list_blobs(
+            settings.GS_BUCKET_NAME, prefix=options['prefix'], fields='items(name),nextPageToken'
+        )
+        count = publish_blobs(blob.name for blob in blobs)
+        self.stdout.write(self.style.SUCCESS(f"Published {count} files"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from core.models import GameSearchDocument
+from core.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Create the full-text search index and reindex every game'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Games indexed per query')
+
+    def handle(self, *args, **options):
+        rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {GameSearchDocument.objects.count()} games"))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Min
+from core.comments import actual_like_count, recompute_like_counts
+from core.models import Comment, Like
+from core.page_cache import invalidate_all
+
+
+class Command(BaseCommand):
+    help = 'Remove duplicate likes and repair Comment.like_count values that have drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report problems without fixing them')
+
+    def handle(self, *args, **options):
+        # Keep the oldest like of every (user, comment) pair
+        first_likes = Like.objects.values('user', 'comment').annotate(first_id=Min('id')).values('first_id')
+        duplicates = Like.objects.exclude(id__in=first_likes)
+
+        with transaction.atomic():
+            if options['dry_run']:
+                duplicate_count = duplicates.count()
+                drifted_count = (
+                    Comment.objects.annotate(actual_count=actual_like_count())
+                    .exclude(like_count=F('actual_count'))
+                    .count()
+                )
+            else:
+                duplicate_count, _ = duplicates.delete()
+                drifted_count = recompute_like_counts()
+                invalidate_all()
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {duplicate_count} duplicate likes and {drifted_count} comments with a wrong like count"
+        ))
@@ -0,0 +1,103 @@
+"""
+Serving of uploaded media when STORAGE_BACKEND is 'local'.
+
+Files are returned as FileResponses around the open file, so WSGI servers with
+sendfile support (gunicorn) copy them from the page cache to the socket without
+passing the bytes through Python. Range requests are supported, which browsers
+need to seek in game trailers; a partial response wraps the file so that only
+the requested bytes are read, while still exposing its descriptor to sendfile.
+"""
+import mimetypes
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangedFile:
+    """
+    A file positioned at the start of a byte range that reads no further than
+    its end. fileno() is passed through, and sendfile takes the start from the
+    file position and the length from the Content-Length header.
+    """
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) byte positions, end inclusive, requested by a
+    Range header with a single range, None to send the whole file, or False
+    when the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        # Malformed or multiple ranges: ignore the header
+        return None
+    first, last = match.groups()
+    if not first:
+        # bytes=-N is the last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def media_response(request, path):
+    """
+    Returns the response for a GET or HEAD of the file at an absolute path,
+    honouring If-Modified-Since and Range.
+    """
+    stat = os.stat(path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    byte_range = parse_range(request.headers.get('Range', ''), stat.st_size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{stat.st_size}'
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response.headers['Content-Length'] = stat.st_size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangedFile(open(path, 'rb'), start, length), content_type=content_type, status=206)
+        response.headers['Content-Length'] = length
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Last-Modified'] = http_date(stat.st_mtime)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
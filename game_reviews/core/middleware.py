@@ -1,14 +1,77 @@
+import time
+
+from django.conf import settings
 from django.shortcuts import redirect
-from django.contrib.auth import logout
+from django.contrib.auth import SESSION_KEY, logout
 from django.contrib import messages
+from django.db import DEFAULT_DB_ALIAS
+
+from .bans import is_banned
+from .instrumentation import finish_request, instrumented_connections, record_request, start_request
+from .replicas import PIN_COOKIE, choose_replica, replica_aliases, reset_read_alias, set_read_alias
+
 
 class BanMiddleware:
+    """
+    Logs banned users out. Reads the user id straight from the session and checks
+    the cached ban state, so request.user is only loaded for banned users.
+    """
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        if request.user.is_authenticated and request.user.banned:
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is not None and is_banned(user_id):
             logout(request)
             messages.error(request, "Your account has been banned. Contact support for more information.")
             return redirect('login')
         return self.get_response(request)
+
+
+class RequestMetricsMiddleware:
+    """
+    Times SQL, outbound HTTP, storage and template rendering for every request,
+    reports them in a Server-Timing header and aggregates them per URL name.
+    Should be the first middleware so the total covers the whole stack.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics, token = start_request()
+        try:
+            with instrumented_connections():
+                response = self.get_response(request)
+        finally:
+            finish_request(token)
+
+        total_seconds = time.perf_counter() - metrics.started
+        response['Server-Timing'] = metrics.server_timing(total_seconds)
+        match = request.resolver_match
+        record_request(match.view_name if match else 'unresolved', metrics, total_seconds)
+        return response
+
+
+class ReplicaMiddleware:
+    """
+    Sends the reads of GET and HEAD requests to a read replica. Requests that can
+    write set a cookie keeping the client's reads on the primary for
+    DB_REPLICA_PIN_SECONDS, so it reads its own writes.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        safe = request.method in ('GET', 'HEAD')
+        token = set_read_alias(choose_replica() if safe and PIN_COOKIE not in request.COOKIES else DEFAULT_DB_ALIAS)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_read_alias(token)
+
+        if not safe:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.DB_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
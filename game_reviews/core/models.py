@@ -1,10 +1,14 @@
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Avg, Case, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Now, Sqrt
 from django.utils import timezone
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from .page_cache import bump_versions
+
 
 
 # User model
@@ -37,6 +41,13 @@ class CustomUser(AbstractUser):
         return self.username
 
 
+# Session a user logged in with, kept by core.bans so a ban can end it
+class UserSession(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='login_sessions')
+    session_key = models.CharField(max_length=40, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 # Game model
 from django.core.files.storage import default_storage
 
@@ -49,6 +60,7 @@ class Game(models.Model):
     release_date = models.DateField()
     age_rating = models.IntegerField()
     image = models.ImageField(upload_to='games/images/', null=True, blank=True)  # For uploaded images
+    image_derivatives = models.JSONField(default=dict, blank=True)  # {format: {width: stored thumbnail}}
     video = models.FileField(upload_to='games/videos/', null=True, blank=True)  # For uploaded videos
     file = models.FileField(upload_to='games/files/', null=True, blank=True)  # For uploaded files
     platform = models.ManyToManyField('Platform', through='GamePlatform', blank=True)
@@ -59,22 +71,105 @@ class Game(models.Model):
     genre = models.TextField(max_length=255, default='empty')
     hidden = models.BooleanField(default=False)
     average_rating = models.FloatField(default=0.0)
+    rating_sum = models.IntegerField(default=0)  # Sum of all review ratings
+    rating_count = models.IntegerField(default=0)  # Number of reviews
+    updated_at = models.DateTimeField(auto_now=True)  # Versions the cached game card fragments
 
-    def __str__(self):
-        return self.title
+    # Only written through apply_rating_change / update_average_rating
+    RATING_AGGREGATE_FIELDS = ('average_rating', 'rating_sum', 'rating_count')
 
     def __str__(self):
         return self.title
 
-
-        # Add this method to update average_rating
+    def image_srcset(self, format_name):
+        thumbnails = sorted(self.image_derivatives.get(format_name, {}).items(), key=lambda item: int(item[0]))
+        return ', '.join(f"{default_storage.url(value)} {width}w" for width, value in thumbnails)
+
+    @property
+    def webp_srcset(self):
+        return self.image_srcset('webp')
+
+    @property
+    def jpeg_srcset(self):
+        return self.image_srcset('jpeg')
+
+    @property
+    def thumbnail_url(self):
+        # The smallest JPEG thumbnail, or the original until thumbnails exist
+        thumbnails = self.image_derivatives.get('jpeg')
+        if thumbnails:
+            return default_storage.url(thumbnails[min(thumbnails, key=int)])
+        return self.image.url if self.image else ''
+
+    def save(self, *args, **kwargs):
+        # Leave the rating aggregates out of full saves, otherwise saving a stale
+        # instance (e.g. from edit_game) would undo reviews submitted meanwhile.
+        # Deferred fields stay out as well, as Django would leave them out itself.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.RATING_AGGREGATE_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def apply_rating_change(game_id, rating_delta, count_delta):
+        """
+        Atomically adjusts the stored rating aggregates with a single UPDATE.
+        The right-hand sides are evaluated against the row's current values,
+        so concurrent reviews never overwrite each other.
+        """
+        new_sum = F('rating_sum') + rating_delta
+        new_count = F('rating_count') + count_delta
+        Game.objects.filter(id=game_id).update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            average_rating=Case(
+                When(rating_count__gt=-count_delta, then=Cast(new_sum, models.FloatField()) / new_count),
+                default=Value(0.0),
+            ),
+            updated_at=Now(),
+        )
+
+    @staticmethod
+    def recompute_rating_aggregates(games=None):
+        """
+        Recomputes the rating aggregates of many games with one set-based UPDATE.
+        """
+        games = Game.objects.all() if games is None else games
+        reviews = Review.objects.filter(game=OuterRef('pk')).order_by().values('game')
+        rating_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+        rating_count = Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total')), 0)
+        return games.update(
+            rating_sum=rating_sum,
+            rating_count=rating_count,
+            average_rating=Coalesce(
+                Subquery(reviews.annotate(average=Avg(Cast('rating', models.FloatField()))).values('average')),
+                Value(0.0),
+            ),
+            updated_at=Now(),
+        )
+
+    # Recompute the aggregates from scratch, e.g. to repair drifted values
     def update_average_rating(self):
-        reviews = self.reviews.all()
-        if reviews.exists():
-            self.average_rating = sum(review.rating for review in reviews) / reviews.count()
-        else:
-            self.average_rating = 0.0
-        self.save()  # Save the updated value
+        totals = self.reviews.aggregate(rating_sum=Sum('rating'), rating_count=Count('id'))
+        self.rating_sum = totals['rating_sum'] or 0
+        self.rating_count = totals['rating_count']
+        self.average_rating = self.rating_sum / self.rating_count if self.rating_count else 0.0
+        self.save(update_fields=['rating_sum', 'rating_count', 'average_rating', 'updated_at'])
+
+
+# Search document, kept in sync with Game by core.search
+class GameSearchDocument(models.Model):
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.TextField()  # Highest weight
+    keywords = models.TextField(blank=True)  # Tags, categories and platforms
+    body = models.TextField(blank=True)  # Genre and description, lowest weight
+
+    def __str__(self):
+        return f"Search document for {self.game_id}"
 
 
 # Comment model
@@ -85,6 +180,14 @@ class Comment(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     game = models.ForeignKey(Game, on_delete=models.CASCADE)
     parent = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE)
+    like_count = models.IntegerField(default=0)  # Maintained by core.comments.toggle_like
+    updated_at = models.DateTimeField(auto_now=True)  # Versions the cached comment fragments
+    steam_recommendation_id = models.CharField(max_length=32, null=True, blank=True)  # Set for imported Steam reviews
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'steam_recommendation_id'], name='unique_steam_review_per_game'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.user.username} on {self.game.title}"
@@ -95,36 +198,214 @@ class Like(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'comment'], name='unique_like_per_user_comment'),
+        ]
+
+
+WILSON_Z = 1.96  # 95% confidence
+
+
+def wilson_lower_bound(positive, negative):
+    """
+    Expression for the lower bound of the Wilson score interval of the share of
+    positive votes: few votes give a low bound, so a review with 10 up and 1 down
+    ranks above one with a single up vote. 0 without votes.
+    """
+    positive = Cast(positive, models.FloatField())
+    # With no votes positive is 0 and the formula below comes out as 0 for n = 1
+    n = Greatest(positive + Cast(negative, models.FloatField()), Value(1.0))
+    share = positive / n
+    z_squared = WILSON_Z * WILSON_Z
+    return (
+        share + z_squared / (2 * n)
+        - WILSON_Z * Sqrt(share * (1 - share) / n + z_squared / (4 * n * n))
+    ) / (1 + z_squared / n)
+
 
 # Review model
 class Review(models.Model):
     comment = models.TextField()
     title = models.CharField(max_length=255)
-    helpful_votes = models.IntegerField(null=True, blank=True, default=0)
+    helpful_votes = models.IntegerField(null=True, blank=True, default=0)  # Up minus down votes
+    upvotes = models.IntegerField(default=0)
+    downvotes = models.IntegerField(default=0)
+    helpfulness_score = models.FloatField(default=0.0)  # wilson_lower_bound(upvotes, downvotes)
     report_count = models.IntegerField(default=0)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='reviews')
     rating = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
     created_at = models.DateTimeField(auto_now_add=True)
-    voters = models.ManyToManyField(CustomUser, related_name="voted_reviews", blank=True)
+    voters = models.ManyToManyField(CustomUser, through='ReviewVote', related_name="voted_reviews", blank=True)
+
+    # Only written through cast_vote / recompute_helpful_votes
+    VOTE_FIELDS = ('helpful_votes', 'upvotes', 'downvotes', 'helpfulness_score')
+    HELPFUL_ORDERING = ('-helpfulness_score', '-created_at', '-id')
+
+    class Meta:
+        indexes = [
+            # "Most helpful" reviews of a game are read straight off this index
+            models.Index(fields=['game', '-helpfulness_score', '-created_at', '-id'], name='review_game_helpful_idx'),
+        ]
+
+    _saved_rating = None  # The rating as loaded, so a save only applies the difference
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Taken from the loaded values: reading self.rating would refetch it when deferred
+        instance = super().from_db(db, field_names, values)
+        if 'rating' in field_names:
+            instance._saved_rating = values[field_names.index('rating')]
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Like Game.save: a stale instance (e.g. from edit_review) must not undo votes cast meanwhile
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.VOTE_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
 
     def has_voted(self, user):
-        return self.voters.filter(id=user.id).exists()
+        return self.votes.filter(user=user).exists()
+
+    def cast_vote(self, user, value):
+        """
+        Records the user's up (1) or down (-1) vote, replacing an earlier opposite vote.
+        The vote counts and helpfulness_score are adjusted with a single F() UPDATE,
+        which also keeps the post_save rating signal from firing. Returns False if
+        the vote was already cast.
+        """
+        with transaction.atomic():
+            vote = ReviewVote.objects.select_for_update().filter(user=user, review=self).first()
+            if vote is None:
+                try:
+                    with transaction.atomic():
+                        ReviewVote.objects.create(user=user, review=self, value=value)
+                except IntegrityError:
+                    # A concurrent request recorded this user's vote first
+                    return False
+                previous = None
+            elif vote.value == value:
+                return False
+            else:
+                ReviewVote.objects.filter(id=vote.id).update(value=value)
+                previous = vote.value
+
+            upvotes = F('upvotes') + int(value == ReviewVote.UP) - int(previous == ReviewVote.UP)
+            downvotes = F('downvotes') + int(value == ReviewVote.DOWN) - int(previous == ReviewVote.DOWN)
+            Review.objects.filter(id=self.id).update(
+                helpful_votes=Coalesce(F('helpful_votes'), 0) + value - (previous or 0),
+                upvotes=upvotes,
+                downvotes=downvotes,
+                # Evaluated against the row as it was, like the counts, so it sees the new counts
+                helpfulness_score=wilson_lower_bound(upvotes, downvotes),
+            )
+            bump_versions(f"game:{self.game_id}")
+        return True
+
+    @staticmethod
+    def recompute_helpful_votes(reviews=None):
+        """
+        Recomputes the vote counts and helpfulness_score from the vote table with
+        one set-based UPDATE.
+        """
+        reviews = Review.objects.all() if reviews is None else reviews
+        votes = ReviewVote.objects.filter(review=OuterRef('pk')).order_by().values('review')
+        upvotes = Coalesce(Subquery(votes.filter(value=ReviewVote.UP).annotate(total=Count('id')).values('total')), 0)
+        downvotes = Coalesce(Subquery(votes.filter(value=ReviewVote.DOWN).annotate(total=Count('id')).values('total')), 0)
+        return reviews.update(
+            helpful_votes=upvotes - downvotes,
+            upvotes=upvotes,
+            downvotes=downvotes,
+            helpfulness_score=wilson_lower_bound(upvotes, downvotes),
+        )
 
     def __str__(self):
         return self.title
 
 
 
-# Signal to update average_rating on review save
-@receiver(post_save, sender=Review)
-def update_game_average_rating_on_save(sender, instance, **kwargs):
-    instance.game.update_average_rating()
+# Review vote model, one row per user and review
+class ReviewVote(models.Model):
+    UP = 1
+    DOWN = -1
+    VALUE_CHOICES = [(UP, 'Up'), (DOWN, 'Down')]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    review = models.ForeignKey(Review, on_delete=models.CASCADE, related_name='votes')
+    value = models.SmallIntegerField(choices=VALUE_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'review'], name='unique_vote_per_user_review'),
+        ]
+
+
+# OCR verification of a critic's uploaded work ID, processed by core.ocr_jobs
+class OCRJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='ocr_jobs')
+    image = models.CharField(max_length=255)  # Storage name of the uploaded image
+    content_hash = models.CharField(max_length=64)  # SHA-256 of the image, for deduplication
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    text = models.TextField(blank=True)
+    verified = models.BooleanField(default=False)
+    confidence = models.FloatField(default=0.0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
-# Signal to update average_rating on review delete
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'content_hash'], name='ocrjob_user_hash_idx'),
+            models.Index(fields=['status', 'updated_at'], name='ocrjob_status_idx'),
+        ]
+
+    PASS_CONFIDENCE = 0.8  # Minimum confidence for a successful verification
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    @property
+    def passed(self):
+        return self.status == self.DONE and self.verified and self.confidence >= self.PASS_CONFIDENCE
+
+    def __str__(self):
+        return f"OCR job {self.id} ({self.status})"
+
+
+# Signal to update the game's rating aggregates on review save
+@receiver(post_save, sender=Review)
+def update_game_average_rating_on_save(sender, instance, created, **kwargs):
+    if created:
+        Game.apply_rating_change(instance.game_id, instance.rating, 1)
+    elif instance._saved_rating is not None and instance.rating != instance._saved_rating:
+        Game.apply_rating_change(instance.game_id, instance.rating - instance._saved_rating, 0)
+    if 'rating' not in instance.get_deferred_fields():
+        instance._saved_rating = instance.rating
+
+# Signal to update the game's rating aggregates on review delete
 @receiver(post_delete, sender=Review)
 def update_game_average_rating_on_delete(sender, instance, **kwargs):
-    instance.game.update_average_rating()
+    rating = instance._saved_rating if instance._saved_rating is not None else instance.rating
+    Game.apply_rating_change(instance.game_id, -rating, -1)
 
 
 # Tag model
@@ -0,0 +1,179 @@
+"""
+OCR of critics' work ID images.
+
+This module does not import Django, so its functions can run in the worker
+processes of core.ocr_jobs without setting Django up there.
+
+Uploads are usually phone photos far larger than Tesseract needs, so they are
+preprocessed first: decoded at reduced size, converted to grayscale, binarized,
+cropped to the text and deskewed before recognition.
+"""
+import io
+import re
+import time
+
+import pytesseract
+from PIL import Image, ImageFilter, ImageOps
+
+REQUIRED_KEYWORDS = ('press', 'journalist', 'photographer')
+ID_PATTERN = r'id[-\s]?\w{4,}'  # Flexible ID pattern: ID, ID-CARD, etc.
+
+# An ID card filling a photo is ~300 DPI at this size, which is what Tesseract is tuned for
+OCR_MAX_SIDE = 2000
+ANALYSIS_SIDE = 600  # Skew and text region are found on a thumbnail of this size
+DESKEW_MAX_ANGLE = 10  # Whole degrees tried in either direction
+DESKEW_STEP = 0.25  # Resolution of the refinement around the best whole degree
+TEXT_DENSITY_RADIUS = 6  # Thumbnail pixels over which edge density is averaged
+TEXT_DENSITY_THRESHOLD = 60  # Edge density (0-255) above which a pixel counts as text
+CROP_MARGIN = 20  # Pixels kept around the text region
+
+
+def otsu_threshold(image):
+    """
+    Returns the gray level that best separates the histogram of a grayscale
+    image into two classes (Otsu's method).
+    """
+    histogram = image.histogram()
+    total = sum(histogram)
+    level_sum = sum(level * count for level, count in enumerate(histogram))
+
+    background_weight = background_sum = 0
+    best_threshold, best_variance = 0, -1.0
+    for level, count in enumerate(histogram):
+        background_weight += count
+        foreground_weight = total - background_weight
+        if background_weight == 0:
+            continue
+        if foreground_weight == 0:
+            break
+        background_sum += level * count
+        background_mean = background_sum / background_weight
+        foreground_mean = (level_sum - background_sum) / foreground_weight
+        variance = background_weight * foreground_weight * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = level, variance
+    return best_threshold
+
+
+def _binarize(image, threshold):
+    return image.point([0] * (threshold + 1) + [255] * (255 - threshold))
+
+
+def _projection_score(inverted, angle):
+    rotated = inverted.rotate(angle, expand=True, fillcolor=0)
+    # Squashing to one column averages every row, giving the horizontal projection profile
+    profile = rotated.resize((1, rotated.height), Image.BOX).tobytes()
+    mean = sum(profile) / len(profile)
+    return sum((value - mean) ** 2 for value in profile)
+
+
+def estimate_skew(sample):
+    """
+    Returns the rotation in degrees that straightens the text lines of a small
+    binarized image: the angle whose projection profile has the highest variance,
+    i.e. the sharpest alternation of text rows and gaps. Searches whole degrees
+    first, then refines around the best one.
+    """
+    inverted = ImageOps.invert(sample)
+    coarse = max(range(-DESKEW_MAX_ANGLE, DESKEW_MAX_ANGLE + 1), key=lambda angle: _projection_score(inverted, angle))
+    candidates = [coarse + step * DESKEW_STEP for step in range(-int(1 / DESKEW_STEP), int(1 / DESKEW_STEP) + 1)]
+    return max(candidates, key=lambda angle: _projection_score(inverted, angle))
+
+
+def find_text_region(sample):
+    """
+    Returns the bounding box of the text in a small binarized image, or None.
+    Text is where black/white edges are dense; the outline of the card or of
+    the photo background is too thin to pass the threshold.
+    """
+    density = sample.filter(ImageFilter.FIND_EDGES).filter(ImageFilter.BoxBlur(TEXT_DENSITY_RADIUS))
+    return density.point([0] * (TEXT_DENSITY_THRESHOLD + 1) + [255] * (255 - TEXT_DENSITY_THRESHOLD)).getbbox()
+
+
+def preprocess_image(image_bytes, max_side=OCR_MAX_SIDE):
+    """
+    Turns an uploaded photo into a downscaled, straight, black on white image of
+    just the text region. Returns a grayscale PIL image.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    scale = max_side / max(image.size)
+    if scale < 1:
+        # JPEGs are decoded directly at 1/2, 1/4 or 1/8 size, saving most of the memory
+        image.draft('L', (int(image.width * scale), int(image.height * scale)))
+    image = ImageOps.exif_transpose(image).convert('L')
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    threshold = otsu_threshold(image)
+
+    # Text region and skew are found on a thumbnail, then applied to the full image
+    sample = _binarize(image, threshold)
+    sample.thumbnail((ANALYSIS_SIDE, ANALYSIS_SIDE))
+    ratio = image.width / sample.width
+
+    # Cropping first keeps the rotation small; the box is a little loose while the text is skewed
+    text_box = find_text_region(sample)
+    if text_box:
+        left, top, right, bottom = (round(value * ratio) for value in text_box)
+        image = image.crop((
+            max(0, left - CROP_MARGIN), max(0, top - CROP_MARGIN),
+            min(image.width, right + CROP_MARGIN), min(image.height, bottom + CROP_MARGIN),
+        ))
+
+    angle = estimate_skew(sample)
+    if angle:
+        image = image.rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+    return _binarize(image, threshold)
+
+
+def extract_text(image_bytes, tesseract_cmd, preprocess=True):
+    """
+    Runs Tesseract on an image and returns the recognised text.
+    """
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    if preprocess:
+        return pytesseract.image_to_string(preprocess_image(image_bytes))
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        return pytesseract.image_to_string(image)
+
+
+def evaluate_id_text(text):
+    """
+    Checks OCR text for press keywords and an ID number. Returns (verified, confidence).
+    """
+    # Normalize the extracted text (lowercase, remove extra spaces)
+    clean_text = " ".join(text.lower().split())
+
+    keyword_verified = any(keyword in clean_text for keyword in REQUIRED_KEYWORDS)
+    id_verified = re.search(ID_PATTERN, clean_text) is not None
+
+    verified = keyword_verified and id_verified
+    return verified, 0.9 if verified else 0.5
+
+
+def profile_ocr(image_bytes, tesseract_cmd, preprocess):
+    """
+    Runs one OCR and reports its timings and peak memory, for the benchmark_ocr
+    command. Meant to run in a fresh process so the peaks belong to this call.
+    """
+    import resource  # Unix only
+
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    start = time.perf_counter()
+    if preprocess:
+        image = preprocess_image(image_bytes)
+    else:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    prepared = time.perf_counter()
+    text = pytesseract.image_to_string(image)
+    finished = time.perf_counter()
+
+    verified, confidence = evaluate_id_text(text)
+    return {
+        'preprocess_ms': round((prepared - start) * 1000, 1),
+        'ocr_ms': round((finished - prepared) * 1000, 1),
+        'ocr_size': list(image.size),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'tesseract_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        'verified': verified,
+        'confidence': confidence,
+    }
@@ -0,0 +1,165 @@
+"""
+Background OCR for critic verification.
+
+verify_critic stores the uploaded image and creates an OCRJob; Tesseract then
+runs in a process pool, so web workers are not tied up for the seconds it
+takes, and the page polls ocr_job_status until the job is finished. Images are
+deduplicated by content hash: uploading the same image again reuses the earlier
+result instead of running OCR twice. Jobs cut short by a restart are picked up
+by the process_ocr_jobs command. core.ocr, with pytesseract and Pillow, is only
+imported once there is an image to read.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .instrumentation import timed
+from .models import OCRJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned workers share no threads, locks or connections with the web process
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.OCR_WORKERS, mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _reset_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def submit_job(user, uploaded_file):
+    """
+    Creates an OCR job for an uploaded ID image and queues it once the current
+    transaction commits. Returns the user's earlier job if they already uploaded
+    the same image, or a finished copy of another job's result for that image.
+    """
+    content = uploaded_file.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    existing = (
+        OCRJob.objects.filter(content_hash=content_hash)
+        .exclude(status=OCRJob.FAILED)
+        .order_by('-created_at')
+    )
+    own_job = existing.filter(user=user).first()
+    if own_job is not None:
+        return own_job
+    done_job = existing.filter(status=OCRJob.DONE).first()
+    if done_job is not None:
+        return OCRJob.objects.create(
+            user=user, image=done_job.image, content_hash=content_hash, status=OCRJob.DONE,
+            text=done_job.text, verified=done_job.verified, confidence=done_job.confidence,
+        )
+
+    extension = os.path.splitext(uploaded_file.name)[1].lower()
+    with timed('storage'):
+        image = default_storage.save(f"uploaded_images/{content_hash}{extension}", ContentFile(content))
+    job = OCRJob.objects.create(user=user, image=image, content_hash=content_hash)
+    transaction.on_commit(partial(enqueue, job.id, content))
+    return job
+
+
+def enqueue(job_id, content):
+    """
+    Hands the image to the process pool; the job is completed from its callback.
+    """
+    from .ocr import extract_text
+
+    OCRJob.objects.filter(id=job_id).update(status=OCRJob.RUNNING, updated_at=timezone.now())
+    executor = get_executor()
+    try:
+        future = executor.submit(extract_text, content, settings.TESSERACT_CMD)
+    except (BrokenProcessPool, RuntimeError) as e:
+        logger.exception("Could not queue OCR job %s: %s", job_id, e)
+        OCRJob.objects.filter(id=job_id).update(status=OCRJob.FAILED, error=str(e), updated_at=timezone.now())
+        _reset_executor(executor)
+        return
+    future.add_done_callback(partial(_finish_job, job_id, executor, threading.current_thread()))
+
+
+def _record_result(job_id, future):
+    from .ocr import evaluate_id_text
+
+    try:
+        text = future.result()
+    except Exception as e:
+        logger.exception("OCR job %s failed: %s", job_id, e)
+        OCRJob.objects.filter(id=job_id).update(status=OCRJob.FAILED, error=str(e), updated_at=timezone.now())
+        return False
+
+    verified, confidence = evaluate_id_text(text)
+    OCRJob.objects.filter(id=job_id).update(
+        status=OCRJob.DONE, text=text, verified=verified, confidence=confidence, error='',
+        updated_at=timezone.now(),
+    )
+    return True
+
+
+def _finish_job(job_id, executor, submitting_thread, future):
+    # Usually runs on the pool's result thread, which must not keep database
+    # connections open. A future that finished before the callback was added
+    # runs it right away on the submitting (request) thread, whose connections
+    # are still in use.
+    try:
+        _record_result(job_id, future)
+        if isinstance(future.exception(), BrokenProcessPool):
+            # A worker died; start a fresh pool for the next job
+            _reset_executor(executor)
+    finally:
+        if threading.current_thread() is not submitting_thread:
+            connections.close_all()
+
+
+def process_stale_jobs(stale_after=timedelta(minutes=10)):
+    """
+    Runs OCR for jobs that are still pending or running stale_after after their
+    last update, e.g. because the web process restarted. Waits for the results
+    and returns (done, failed) counts. A job whose image cannot be read or queued
+    fails on its own, without holding up the others.
+    """
+    from .ocr import extract_text
+
+    cutoff = timezone.now() - stale_after
+    jobs = OCRJob.objects.filter(status__in=[OCRJob.PENDING, OCRJob.RUNNING], updated_at__lt=cutoff)
+
+    futures = {}
+    failed = 0
+    for job in jobs:
+        try:
+            with default_storage.open(job.image) as image:
+                content = image.read()
+            OCRJob.objects.filter(id=job.id).update(status=OCRJob.RUNNING, updated_at=timezone.now())
+            futures[job.id] = get_executor().submit(extract_text, content, settings.TESSERACT_CMD)
+        except Exception as e:
+            logger.exception("Could not rerun OCR job %s: %s", job.id, e)
+            OCRJob.objects.filter(id=job.id).update(status=OCRJob.FAILED, error=str(e), updated_at=timezone.now())
+            failed += 1
+
+    done = sum(_record_result(job_id, future) for job_id, future in futures.items())
+    return done, failed + len(futures) - done
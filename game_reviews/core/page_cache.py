@@ -0,0 +1,230 @@
+"""
+Full-page cache for anonymous visitors.
+
+Cached pages are keyed by path, the query parameters the views read and the
+current value of the version keys the page depends on: 'games' for anything
+listing games and 'game:<id>' for a game's detail page. Model signals bump those
+versions when games, reviews or comments change (core.comments.toggle_like does
+it for likes, without a signal's extra queries), which makes every page
+built from the old data unreachable at once without having to know their keys.
+A global 'all' version is part of every key, for bulk writes that bypass signals.
+
+While one worker builds a missing page, others requesting it wait briefly for
+the result instead of rendering it too. Pages are built from the primary
+database, as a page rendered from a lagging replica would outlive the lag.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils.cache import patch_vary_headers
+
+from .replicas import primary_reads
+
+CACHED_QUERY_PARAMS = ('page', 'cursor', 'q', 'sort', 'order', 'comments_per_page')
+LOCK_TIMEOUT = 10  # Seconds after which an abandoned rebuild lock expires
+WAIT_TIMEOUT = 2.0  # Seconds to wait for another worker's rebuild
+POLL_INTERVAL = 0.05
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(view_name, outcome):
+    with _stats_lock:
+        _stats[(view_name, outcome)] += 1
+
+
+def stats():
+    """
+    Returns the hit/miss counters of this worker process, per view.
+    """
+    with _stats_lock:
+        counters = {}
+        for (view_name, outcome), count in _stats.items():
+            counters.setdefault(view_name, {})[outcome] = count
+    return counters
+
+
+def _version_key(name):
+    return f"page_version:{name}"
+
+
+def get_versions(names):
+    keys = [_version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A time based start value never repeats one an evicted version had
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    """
+    Invalidates every cached page depending on one of the versions, once the
+    current transaction commits.
+    """
+    def bump():
+        for name in names:
+            try:
+                cache.incr(_version_key(name))
+            except ValueError:
+                # Not set: no page was cached against it, the next read starts a new one
+                pass
+    transaction.on_commit(bump)
+
+
+def invalidate_all():
+    bump_versions('all')
+
+
+def is_cacheable(request):
+    # Only logged-out visitors without pending flash messages get shared pages
+    return (
+        request.method in ('GET', 'HEAD')
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and 'messages' not in request.COOKIES
+    )
+
+
+def _page_key(request, versions):
+    params = sorted(
+        (name, value)
+        for name in CACHED_QUERY_PARAMS
+        for value in request.GET.getlist(name)
+    )
+    raw = f"{request.path}?{urlencode(params)}#{'.'.join(map(str, versions))}"
+    return f"page:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def _store(key, response):
+    # Pages that set cookies (e.g. a CSRF token) are specific to one visitor
+    if response.status_code == 200 and not response.cookies and not getattr(response, 'streaming', False):
+        cache.set(key, response, settings.PAGE_CACHE_TTL)
+
+
+def cache_anonymous_page(*version_names):
+    """
+    Caches the view's response for anonymous visitors. version_names are the
+    versions the page depends on, formatted with the view's keyword arguments,
+    e.g. @cache_anonymous_page('game:{game_id}'). Works on sync and async views.
+    """
+    def decorator(view):
+        view_name = view.__name__
+
+        def page_key(request, kwargs):
+            names = ['all'] + [name.format(**kwargs) for name in version_names]
+            return _page_key(request, get_versions(names))
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                _count(view_name, 'bypass')
+                return view(request, *args, **kwargs)
+
+            key = page_key(request, kwargs)
+            response = cache.get(key)
+            if response is not None:
+                _count(view_name, 'hit')
+                return response
+
+            lock_key = f"{key}:lock"
+            if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+                # Another worker is building this page, give it a moment
+                deadline = time.monotonic() + WAIT_TIMEOUT
+                while time.monotonic() < deadline:
+                    time.sleep(POLL_INTERVAL)
+                    response = cache.get(key)
+                    if response is not None:
+                        _count(view_name, 'wait_hit')
+                        return response
+                _count(view_name, 'wait_miss')
+                return view(request, *args, **kwargs)
+
+            _count(view_name, 'miss')
+            try:
+                with primary_reads():
+                    response = view(request, *args, **kwargs)
+                patch_vary_headers(response, ('Cookie',))
+                _store(key, response)
+            finally:
+                cache.delete(lock_key)
+            return response
+
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not is_cacheable(request):
+                _count(view_name, 'bypass')
+                return await view(request, *args, **kwargs)
+
+            key = await sync_to_async(page_key)(request, kwargs)
+            response = await cache.aget(key)
+            if response is not None:
+                _count(view_name, 'hit')
+                return response
+
+            lock_key = f"{key}:lock"
+            if not await cache.aadd(lock_key, 1, LOCK_TIMEOUT):
+                deadline = time.monotonic() + WAIT_TIMEOUT
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(POLL_INTERVAL)
+                    response = await cache.aget(key)
+                    if response is not None:
+                        _count(view_name, 'wait_hit')
+                        return response
+                _count(view_name, 'wait_miss')
+                return await view(request, *args, **kwargs)
+
+            _count(view_name, 'miss')
+            try:
+                with primary_reads():
+                    response = await view(request, *args, **kwargs)
+                patch_vary_headers(response, ('Cookie',))
+                await sync_to_async(_store)(key, response)
+            finally:
+                await cache.adelete(lock_key)
+            return response
+
+        return async_wrapper if asyncio.iscoroutinefunction(view) else wrapper
+    return decorator
+
+
+def _game_versions(game_ids):
+    return [f"game:{game_id}" for game_id in game_ids if game_id is not None]
+
+
+def game_changed(sender, instance, **kwargs):
+    from .models import Game
+
+    # Detail pages show the parent game and the DLC titles as well
+    related_ids = [instance.id, instance.parent_game_id]
+    related_ids += Game.objects.filter(parent_game_id=instance.id).values_list('id', flat=True)
+    bump_versions('games', *_game_versions(related_ids))
+
+
+def review_changed(sender, instance, **kwargs):
+    # Reviews change the average rating shown in the game lists
+    bump_versions('games', *_game_versions([instance.game_id]))
+
+
+def comment_changed(sender, instance, **kwargs):
+    bump_versions(*_game_versions([instance.game_id]))
+
+
+def connect_signals():
+    from .models import Comment, Game, Review
+
+    for model, handler in ((Game, game_changed), (Review, review_changed), (Comment, comment_changed)):
+        post_save.connect(handler, sender=model, dispatch_uid=f'page_cache_save_{model.__name__}')
+        post_delete.connect(handler, sender=model, dispatch_uid=f'page_cache_delete_{model.__name__}')
@@ -0,0 +1,123 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET/COUNT, a page is fetched with a WHERE clause that continues
+from the last row of the previous page, so page N costs the same as page 1.
+The ordering must end in a unique field (normally the primary key) to break ties.
+"""
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+
+class CursorPage:
+    """
+    One page of a CursorPaginator. Supports the parts of Django's Page used by the
+    templates (iteration, has_next/has_previous) plus next_cursor/previous_cursor.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        # (field name, descending) for every ordering term
+        self.keys = [(term.lstrip('-'), term.startswith('-')) for term in self.ordering]
+
+    def encode_cursor(self, direction, obj):
+        values = [getattr(obj, name) for name, _ in self.keys]
+        # str() keeps full microsecond precision for datetimes, unlike DjangoJSONEncoder
+        payload = json.dumps([direction, values], default=str)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Returns (direction, values) for a cursor token, or None if it is invalid.
+        """
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(payload)
+            if direction not in ('next', 'previous') or len(values) != len(self.keys):
+                return None
+            model = self.queryset.model
+            values = [model._meta.get_field(name).to_python(value) for (name, _), value in zip(self.keys, values)]
+        except (binascii.Error, ValueError, TypeError, ValidationError, FieldDoesNotExist):
+            return None
+        return direction, values
+
+    def _seek(self, values, forward):
+        """
+        Builds the WHERE clause for rows strictly after (or before) the given key,
+        e.g. for ('-release_date', '-id'): release_date < d OR (release_date = d AND id < i).
+        """
+        condition = Q()
+        for index, (name, descending) in enumerate(self.keys):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f"{name}__{lookup}": values[index]})
+            for (previous_name, _), previous_value in zip(self.keys[:index], values):
+                term &= Q(**{previous_name: previous_value})
+            condition |= term
+        return condition
+
+    def get_page(self, cursor=None):
+        decoded = self.decode_cursor(cursor) if cursor else None
+        queryset = self.queryset
+
+        if decoded is None:
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, False
+        elif decoded[0] == 'next':
+            rows = list(queryset.filter(self._seek(decoded[1], True)).order_by(*self.ordering)[:self.per_page + 1])
+            has_more, has_before = len(rows) > self.per_page, True
+        else:
+            reversed_ordering = [term[1:] if term.startswith('-') else f"-{term}" for term in self.ordering]
+            rows = list(queryset.filter(self._seek(decoded[1], False)).order_by(*reversed_ordering)[:self.per_page + 1])
+            has_before, has_more = len(rows) > self.per_page, True
+            rows = rows[:self.per_page][::-1]
+
+        rows = rows[:self.per_page]
+        next_cursor = self.encode_cursor('next', rows[-1]) if rows and has_more else None
+        previous_cursor = self.encode_cursor('previous', rows[0]) if rows and has_before else None
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+
+def paginate(request, queryset, per_page, ordering, allow_cursor=True):
+    """
+    Paginates queryset in the given ordering. Uses keyset pagination when
+    PAGINATION_MODE is 'cursor' or the request carries a cursor, and Django's
+    Paginator (?page=N) otherwise.
+    """
+    cursor = request.GET.get('cursor')
+    if allow_cursor and (cursor or settings.PAGINATION_MODE == 'cursor'):
+        return CursorPaginator(queryset, per_page, ordering).get_page(cursor)
+    return Paginator(queryset.order_by(*ordering), per_page).get_page(request.GET.get('page'))
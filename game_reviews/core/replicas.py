@@ -0,0 +1,93 @@
+"""
+Read replicas.
+
+Every database alias besides 'default' is a read replica of it. ReplicaMiddleware
+picks one replica per GET or HEAD request and ReplicaRouter sends that request's
+reads to it; writes, and reads in other requests, go to the primary. Clients
+that just wrote carry a short-lived cookie that keeps their reads on the primary,
+so they see their own changes despite replication lag. Within a request, reads
+return to the primary as soon as it writes or opens a transaction.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'db_primary'
+# A session missing from a lagging replica would log its user out
+PRIMARY_ONLY_APPS = ('sessions',)
+
+_read_alias = ContextVar('read_alias', default=DEFAULT_DB_ALIAS)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def choose_replica():
+    aliases = replica_aliases()
+    return random.choice(aliases) if aliases else DEFAULT_DB_ALIAS
+
+
+def set_read_alias(alias):
+    return _read_alias.set(alias)
+
+
+def reset_read_alias(token):
+    _read_alias.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Sends the reads inside the block to the primary.
+    """
+    token = _read_alias.set(DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Later reads of this request have to see the write
+        _read_alias.set(DEFAULT_DB_ALIAS)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def replica_lag():
+    """
+    Returns how many seconds each replica is behind the primary, 0 when it has
+    replayed everything it received, or None when that cannot be told (e.g. the
+    database is not a PostgreSQL standby).
+    """
+    lag = {}
+    for alias in replica_aliases():
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            lag[alias] = None
+            continue
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT CASE WHEN NOT pg_is_in_recovery() THEN NULL "
+                "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            )
+            seconds = cursor.fetchone()[0]
+        lag[alias] = None if seconds is None else float(seconds)
+    return lag
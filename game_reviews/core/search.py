@@ -0,0 +1,271 @@
+"""
+Full-text search for games.
+
+Every game has a GameSearchDocument row holding its text in three weighted parts
+(title > tags/categories/platforms > genre/description). The database specific
+backend indexes that table: PostgreSQL through a generated, GIN indexed tsvector
+column and SQLite through an FTS5 table kept in sync by triggers. Documents are
+rebuilt whenever a game or one of its tag/category/platform links changes.
+"""
+import re
+
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+from .models import Category, Game, GameCategory, GamePlatform, GameSearchDocument, GameTag, Platform, Tag
+
+MAX_QUERY_TERMS = 8
+
+
+def tokenize(query):
+    """
+    Splits a search query into lowercase words, dropping punctuation and operators.
+    """
+    return re.findall(r'[^\W_]+', query.lower())[:MAX_QUERY_TERMS]
+
+
+class BasicSearchBackend:
+    """
+    Fallback for databases without full-text support: substring matching on the
+    precomputed documents, so a search still touches a single table.
+    """
+
+    def setup(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, games, query):
+        terms = tokenize(query)
+        if not terms:
+            return games.annotate(search_rank=Value(0.0)).none()
+        matches = Q()
+        for term in terms:
+            matches &= (
+                Q(search_document__title__icontains=term) |
+                Q(search_document__keywords__icontains=term) |
+                Q(search_document__body__icontains=term)
+            )
+        # Rank games whose title matches above matches in the other parts
+        return games.filter(matches).annotate(
+            search_rank=Case(
+                When(search_document__title__icontains=terms[0], then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+
+
+class PostgresSearchBackend(BasicSearchBackend):
+    """
+    Weighted tsvector generated from the document columns, with a GIN index.
+    """
+    table = GameSearchDocument._meta.db_table
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                ALTER TABLE {self.table} ADD COLUMN IF NOT EXISTS vector tsvector GENERATED ALWAYS AS (
+                    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                    setweight(to_tsvector('english', coalesce(keywords, '')), 'B') ||
+                    setweight(to_tsvector('english', coalesce(body, '')), 'C')
+                ) STORED
+            """)
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_vector_gin ON {self.table} USING GIN (vector)")
+
+    def search(self, games, query):
+        terms = tokenize(query)
+        if not terms:
+            return games.annotate(search_rank=Value(0.0)).none()
+        # Prefix match every word, e.g. "dark soul" -> dark:* & soul:*
+        tsquery = ' & '.join(f"{term}:*" for term in terms)
+        game_table = Game._meta.db_table
+        return games.filter(
+            id__in=RawSQL(
+                f"SELECT game_id FROM {self.table} WHERE vector @@ to_tsquery('english', %s)", [tsquery]
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT ts_rank(vector, to_tsquery('english', %s)) FROM {self.table} "
+                f"WHERE game_id = {game_table}.id",
+                [tsquery],
+            )
+        )
+
+
+class SQLiteSearchBackend(BasicSearchBackend):
+    """
+    FTS5 external-content table over the document table, ranked with weighted bm25.
+    """
+    table = GameSearchDocument._meta.db_table
+    fts_table = 'core_gamesearch_fts'
+    # bm25 column weights for title, keywords and body
+    weights = (10.0, 4.0, 1.0)
+
+    def setup(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_table} USING fts5(
+                    title, keywords, body,
+                    content='{self.table}', content_rowid='game_id', tokenize='porter unicode61'
+                )
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ai AFTER INSERT ON {self.table} BEGIN
+                    INSERT INTO {self.fts_table}(rowid, title, keywords, body)
+                    VALUES (new.game_id, new.title, new.keywords, new.body);
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {self.fts_table}_ad AFTER DELETE ON {self.table} BEGIN
+                    INSERT INTO {self.fts_table}({self.fts_table}, rowid, title, keywords, body)
+                    VALUES ('delete', old.game_id, old.title, old.keywords, old.body);
+                END
+            """)
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {self.fts_table}_au AFTER UPDATE ON {self.table} BEGIN
+                    INSERT INTO {self.fts_table}({self.fts_table}, rowid, title, keywords, body)
+                    VALUES ('delete', old.game_id, old.title, old.keywords, old.body);
+                    INSERT INTO {self.fts_table}(rowid, title, keywords, body)
+                    VALUES (new.game_id, new.title, new.keywords, new.body);
+                END
+            """)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.fts_table}({self.fts_table}) VALUES ('rebuild')")
+
+    def search(self, games, query):
+        terms = tokenize(query)
+        if not terms:
+            return games.annotate(search_rank=Value(0.0)).none()
+        # Prefix match every word, e.g. "dark soul" -> "dark"* "soul"*
+        match = ' '.join(f'"{term}"*' for term in terms)
+        game_table = Game._meta.db_table
+        weights = ', '.join(str(weight) for weight in self.weights)
+        return games.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {self.fts_table} WHERE {self.fts_table} MATCH %s", [match])
+        ).annotate(
+            # bm25 is lower for better matches, negate it so higher ranks first like ts_rank
+            search_rank=RawSQL(
+                f"SELECT -bm25({self.fts_table}, {weights}) FROM {self.fts_table} "
+                f"WHERE {self.fts_table} MATCH %s AND rowid = {game_table}.id",
+                [match],
+            )
+        )
+
+
+def get_search_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    return BasicSearchBackend()
+
+
+def search_games(games, query):
+    """
+    Filters a Game queryset down to the games matching query and annotates each
+    with search_rank (higher is better).
+    """
+    return get_search_backend().search(games, query)
+
+
+def index_games(game_ids):
+    """
+    Rebuilds the search documents of the given games, dropping those of deleted games.
+    """
+    game_ids = set(game_ids)
+    games = Game.objects.filter(id__in=game_ids).prefetch_related('tags', 'category', 'platform')
+    documents = [
+        GameSearchDocument(
+            game=game,
+            title=game.title,
+            keywords=' '.join(
+                [tag.tag_name for tag in game.tags.all()] +
+                [category.category_name for category in game.category.all()] +
+                [platform.platform_name for platform in game.platform.all()]
+            ),
+            body=f"{game.genre} {game.description}",
+        )
+        for game in games
+    ]
+    GameSearchDocument.objects.bulk_create(
+        documents, update_conflicts=True, unique_fields=['game'], update_fields=['title', 'keywords', 'body']
+    )
+    missing_ids = game_ids - {document.game_id for document in documents}
+    if missing_ids:
+        GameSearchDocument.objects.filter(game_id__in=missing_ids).delete()
+
+
+def rebuild_index(batch_size=1000):
+    """
+    Creates the backend's index structures and reindexes every game.
+    """
+    backend = get_search_backend()
+    backend.setup()
+    game_ids = list(Game.objects.values_list('id', flat=True))
+    for start in range(0, len(game_ids), batch_size):
+        index_games(game_ids[start:start + batch_size])
+    backend.rebuild()
+
+
+def schedule_reindex(game_ids):
+    # Wait for the surrounding transaction, so cascaded deletes and bulk link
+    # changes are indexed once, in their final state
+    game_ids = set(game_ids)
+    if game_ids:
+        transaction.on_commit(lambda: index_games(game_ids))
+
+
+# Signal handlers
+
+def reindex_game(sender, instance, **kwargs):
+    schedule_reindex([instance.id])
+
+
+def reindex_linked_game(sender, instance, **kwargs):
+    schedule_reindex([instance.game_id])
+
+
+def reindex_games_with_term(sender, instance, created=False, **kwargs):
+    if not created:
+        link_model, field = TERM_LINKS[sender]
+        schedule_reindex(link_model.objects.filter(**{field: instance}).values_list('game_id', flat=True))
+
+
+def reindex_changed_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            schedule_reindex([instance.id])
+    elif action in ('post_add', 'post_remove'):
+        schedule_reindex(pk_set)
+    elif action == 'pre_clear':
+        # The links are gone by post_clear, so collect the affected games now
+        field = sender._meta.get_field(LINK_TERM_FIELDS[sender]).attname
+        schedule_reindex(sender.objects.filter(**{field: instance.pk}).values_list('game_id', flat=True))
+
+
+TERM_LINKS = {
+    Tag: (GameTag, 'tag'),
+    Category: (GameCategory, 'category'),
+    Platform: (GamePlatform, 'platform'),
+}
+LINK_TERM_FIELDS = {link_model: field for link_model, field in TERM_LINKS.values()}
+
+
+def setup_search_backend(sender, using, **kwargs):
+    if using == 'default':
+        get_search_backend().setup()
+
+
+def connect_signals():
+    post_save.connect(reindex_game, sender=Game, dispatch_uid='search_reindex_game')
+    for term_model, (link_model, field) in TERM_LINKS.items():
+        post_save.connect(reindex_linked_game, sender=link_model, dispatch_uid=f'search_save_{field}')
+        post_delete.connect(reindex_linked_game, sender=link_model, dispatch_uid=f'search_delete_{field}')
+        post_save.connect(reindex_games_with_term, sender=term_model, dispatch_uid=f'search_rename_{field}')
+        m2m_changed.connect(reindex_changed_links, sender=link_model, dispatch_uid=f'search_m2m_{field}')
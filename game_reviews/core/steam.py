@@ -0,0 +1,116 @@
+from django.conf import settings
+from django.db import transaction
+
+from .instrumentation import timed
+from .models import Comment, CustomUser
+from .page_cache import bump_versions
+
+REVIEWS_PER_PAGE = 100  # Steam's maximum for num_per_page
+
+
+def iter_steam_reviews(app_id, max_pages=None, session=None):
+    """
+    Yields the reviews of a Steam app page by page, following Steam's cursor
+    pagination until it runs out of reviews, repeats a cursor or hits max_pages.
+    """
+    if session is None:
+        import requests  # Imported on first use to keep worker start fast
+
+        session = requests.Session()
+    url = f"{settings.STEAM_STORE_URL}/appreviews/{app_id}"
+    cursor = '*'
+    seen_cursors = set()
+    pages = 0
+
+    while max_pages is None or pages < max_pages:
+        seen_cursors.add(cursor)
+        with timed('http'):
+            response = session.get(url, params={
+                'json': 1,
+                'filter': 'recent',
+                'language': 'english',
+                'num_per_page': REVIEWS_PER_PAGE,
+                'cursor': cursor,
+            }, timeout=settings.STEAM_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        pages += 1
+
+        reviews = data.get('reviews', [])
+        yield from reviews
+
+        cursor = data.get('cursor')
+        if not reviews or not cursor or cursor in seen_cursors:
+            break
+
+
+def get_steam_user():
+    """
+    Returns the user that imported Steam reviews are attributed to.
+    """
+    steam_user, created = CustomUser.objects.get_or_create(
+        username="steam_user",
+        defaults={"email": "steam@example.com", "role": "user"}
+    )
+    if created:
+        steam_user.set_unusable_password()
+        steam_user.save(update_fields=['password'])
+    return steam_user
+
+
+def _upsert_comments(game, steam_user, reviews):
+    # Steam pages can overlap, and a single INSERT .. ON CONFLICT may not touch a row twice
+    comments = {
+        recommendation_id: Comment(
+            comment=content, user=steam_user, game=game, steam_recommendation_id=recommendation_id
+        )
+        for recommendation_id, content in reviews
+    }
+    Comment.objects.bulk_create(
+        comments.values(),
+        update_conflicts=True,
+        unique_fields=['game', 'steam_recommendation_id'],
+        update_fields=['comment', 'updated_at'],
+    )
+    return len(comments)
+
+
+def _remove_legacy_comments(game, steam_user):
+    # Imports from before steam_recommendation_id existed cannot be matched to
+    # their reviews; replace them, as those imports did on every run
+    Comment.objects.filter(game=game, user=steam_user, steam_recommendation_id__isnull=True).delete()
+
+
+def import_steam_reviews(game, max_pages=None, batch_size=500, session=None):
+    """
+    Streams a game's Steam reviews into comments, writing them in bulk batches.
+    Reviews are keyed by Steam's recommendationid, so re-importing updates the
+    existing comments instead of duplicating them. Returns the number of reviews written.
+    """
+    steam_user = get_steam_user()
+    imported_count = 0
+    batch = []
+
+    def write(batch):
+        if imported_count:
+            return _upsert_comments(game, steam_user, batch)
+        # Only once Steam has answered, so a failed import keeps the old comments
+        with transaction.atomic():
+            _remove_legacy_comments(game, steam_user)
+            return _upsert_comments(game, steam_user, batch)
+
+    for review in iter_steam_reviews(game.steam_app_id, max_pages=max_pages, session=session):
+        content = review.get("review", "")
+        recommendation_id = review.get("recommendationid")
+        if not content or not recommendation_id:
+            continue
+        batch.append((str(recommendation_id), content))
+        if len(batch) >= batch_size:
+            imported_count += write(batch)
+            batch = []
+
+    if batch:
+        imported_count += write(batch)
+    # Bulk upserts send no signals
+    bump_versions(f"game:{game.id}")
+    return imported_count
@@ -1,3 +1,711 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from contextlib import ExitStack
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.utils.http import http_date
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.http import Http404
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import ocr_jobs, replicas, views
+from .bans import ban, is_banned
+from .comments import toggle_like
+from .forms import GameForm
+from .media import media_response, parse_range
+from .pagination import CursorPaginator
+from .models import (
+    Category, Comment, CustomUser, Game, GameSearchDocument, GameTag, Like, OCRJob, Platform, Review, ReviewVote,
+    Tag, UserSession,
+)
+from .search import BasicSearchBackend, index_games, schedule_reindex, search_games
+from .steam import get_steam_user, import_steam_reviews
+
+
+def make_user(username, role='user'):
+    return CustomUser.objects.create_user(username=username, email=f"{username}@example.com", role=role)
+
+
+def make_game(title, **fields):
+    defaults = {
+        'description': 'A game',
+        'developer': 'Developer',
+        'publisher': 'Publisher',
+        'release_date': datetime.date(2020, 1, 1),
+        'age_rating': 12,
+    }
+    return Game.objects.create(title=title, **{**defaults, **fields})
+
+
+class SearchTests(TestCase):
+    def create_game(self, title, **fields):
+        # Documents are rebuilt on commit, which TestCase only runs when asked to
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_game(title, **fields)
+
+    def search(self, query, games=None):
+        games = Game.objects.all() if games is None else games
+        return list(search_games(games, query).order_by('-search_rank', 'id').values_list('title', flat=True))
+
+    def test_saving_a_game_indexes_it(self):
+        game = self.create_game('Dark Souls', genre='RPG', description='Die often')
+        document = GameSearchDocument.objects.get(game=game)
+        self.assertEqual(document.title, 'Dark Souls')
+        self.assertEqual(document.body, 'RPG Die often')
+        self.assertEqual(self.search('dark'), ['Dark Souls'])
+        self.assertEqual(self.search('die'), ['Dark Souls'])
+
+    def test_editing_a_game_reindexes_it(self):
+        game = self.create_game('Dark Souls')
+        game.title = 'Elden Ring'
+        with self.captureOnCommitCallbacks(execute=True):
+            game.save()
+        self.assertEqual(self.search('dark'), [])
+        self.assertEqual(self.search('elden'), ['Elden Ring'])
+
+    def test_words_are_prefix_matched_and_all_required(self):
+        self.create_game('Dark Souls')
+        self.create_game('Dark Forest')
+        self.assertEqual(self.search('dar sou'), ['Dark Souls'])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_title_matches_rank_above_description_matches(self):
+        self.create_game('Quiet Farm', description='A space adventure')
+        self.create_game('Space Station', description='Build it')
+        self.assertEqual(self.search('space'), ['Space Station', 'Quiet Farm'])
+
+    def test_tag_category_and_platform_links_reindex_the_game(self):
+        game = self.create_game('Celeste')
+        tag = Tag.objects.create(tag_name='platformer')
+        category = Category.objects.create(category_name='indie')
+        platform = Platform.objects.create(platform_name='switch')
+        with self.captureOnCommitCallbacks(execute=True):
+            game.tags.add(tag)
+            game.category.add(category)
+        with self.captureOnCommitCallbacks(execute=True):
+            game.platform.add(platform)
+        for query in ('platformer', 'indie', 'switch'):
+            self.assertEqual(self.search(query), ['Celeste'], query)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            game.tags.remove(tag)
+        self.assertEqual(self.search('platformer'), [])
+
+        # Link rows saved directly, as the admin does
+        with self.captureOnCommitCallbacks(execute=True):
+            GameTag.objects.create(game=game, tag=tag)
+        self.assertEqual(self.search('platformer'), ['Celeste'])
+
+    def test_renaming_a_tag_reindexes_its_games(self):
+        game = self.create_game('Celeste')
+        tag = Tag.objects.create(tag_name='platformer')
+        with self.captureOnCommitCallbacks(execute=True):
+            game.tags.add(tag)
+        tag.tag_name = 'climbing'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertEqual(self.search('platformer'), [])
+        self.assertEqual(self.search('climbing'), ['Celeste'])
+
+    def test_clearing_links_from_the_term_side_reindexes_the_games(self):
+        game = self.create_game('Celeste')
+        tag = Tag.objects.create(tag_name='platformer')
+        with self.captureOnCommitCallbacks(execute=True):
+            game.tags.add(tag)
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.game_set.clear()
+        self.assertEqual(self.search('platformer'), [])
+
+    def test_deleted_games_drop_out_of_the_index(self):
+        game = self.create_game('Dark Souls')
+        game_id = game.id
+        game.delete()
+        index_games([game_id])
+        self.assertFalse(GameSearchDocument.objects.filter(game_id=game_id).exists())
+        self.assertEqual(self.search('dark'), [])
+
+    def test_schedule_reindex_waits_for_commit(self):
+        game = self.create_game('Dark Souls')
+        Game.objects.filter(id=game.id).update(title='Elden Ring')
+        with self.captureOnCommitCallbacks() as callbacks:
+            schedule_reindex([game.id])
+        self.assertEqual(self.search('elden'), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.search('elden'), ['Elden Ring'])
+
+    def test_game_list_hides_hidden_games_from_visitors(self):
+        self.create_game('Dark Souls')
+        self.create_game('Dark Forest', hidden=True)
+        response = self.client.get('/games/', {'q': 'dark'})
+        titles = [game.title for game in response.context['games']]
+        self.assertEqual(titles, ['Dark Souls'])
+
+    def test_basic_backend_matches_documents(self):
+        self.create_game('Dark Souls', genre='RPG')
+        self.create_game('Stardew Valley', description='Dark caves below the farm')
+        games = BasicSearchBackend().search(Game.objects.all(), 'dark')
+        ranked = games.order_by('-search_rank', 'id').values_list('title', flat=True)
+        self.assertEqual(list(ranked), ['Dark Souls', 'Stardew Valley'])
+        self.assertFalse(BasicSearchBackend().search(Game.objects.all(), 'rpg souls valley').exists())
+
+
+class FakeSteamResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        if self.data is None:
+            raise OSError("Steam is unavailable")
+
+    def json(self):
+        return self.data
+
+
+class FakeSteamSession:
+    """
+    Stands in for requests.Session, answering appreviews requests from a dict
+    of cursor -> (reviews, next cursor).
+    """
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.cursors = []
+
+    def get(self, url, params, timeout):
+        self.cursors.append(params['cursor'])
+        if self.pages is None:
+            return FakeSteamResponse(None)
+        reviews, cursor = self.pages.get(params['cursor'], ([], None))
+        return FakeSteamResponse({'success': 1, 'reviews': reviews, 'cursor': cursor})
+
+
+def steam_review(recommendation_id, text):
+    return {'recommendationid': recommendation_id, 'review': text}
+
+
+class SteamImportTests(TestCase):
+    def setUp(self):
+        self.game = make_game('Portal', steam_app_id=400)
+        self.pages = {
+            '*': ([steam_review('1', 'Great'), steam_review('2', 'Short')], 'page2'),
+            'page2': ([steam_review('3', 'Funny'), steam_review('4', '')], 'page3'),
+            'page3': ([], 'page3'),
+        }
+
+    def import_reviews(self, pages=None, **options):
+        return import_steam_reviews(self.game, session=FakeSteamSession(pages or self.pages), **options)
+
+    def imported(self):
+        comments = Comment.objects.filter(game=self.game).order_by('steam_recommendation_id')
+        return list(comments.values_list('steam_recommendation_id', 'comment'))
+
+    def test_first_import_follows_the_cursor_and_inserts_comments(self):
+        session = FakeSteamSession(self.pages)
+        self.assertEqual(import_steam_reviews(self.game, session=session, batch_size=2), 3)
+        self.assertEqual(session.cursors, ['*', 'page2', 'page3'])
+        self.assertEqual(self.imported(), [('1', 'Great'), ('2', 'Short'), ('3', 'Funny')])
+
+    def test_reimport_updates_instead_of_duplicating(self):
+        self.import_reviews()
+        first_ids = set(Comment.objects.filter(game=self.game).values_list('id', flat=True))
+        self.pages['*'] = ([steam_review('1', 'Great, edited'), steam_review('2', 'Short')], 'page2')
+
+        self.assertEqual(self.import_reviews(), 3)
+        self.assertEqual(self.imported(), [('1', 'Great, edited'), ('2', 'Short'), ('3', 'Funny')])
+        self.assertEqual(set(Comment.objects.filter(game=self.game).values_list('id', flat=True)), first_ids)
+
+    def test_max_pages_stops_early(self):
+        self.assertEqual(self.import_reviews(max_pages=1), 2)
+        self.assertEqual(self.imported(), [('1', 'Great'), ('2', 'Short')])
+
+    def test_legacy_unkeyed_comments_are_replaced(self):
+        steam_user = get_steam_user()
+        Comment.objects.create(game=self.game, user=steam_user, comment='Great')
+        other_game = make_game('Portal 2')
+        kept = Comment.objects.create(game=other_game, user=steam_user, comment='Other game')
+
+        self.import_reviews()
+        self.assertEqual(self.imported(), [('1', 'Great'), ('2', 'Short'), ('3', 'Funny')])
+        self.assertTrue(Comment.objects.filter(id=kept.id).exists())
+
+    def test_failed_import_keeps_existing_comments(self):
+        Comment.objects.create(game=self.game, user=get_steam_user(), comment='Great')
+        with self.assertRaises(OSError):
+            import_steam_reviews(self.game, session=FakeSteamSession(None))
+        self.assertEqual(self.imported(), [(None, 'Great')])
+
+
+class ImmediateExecutor:
+    """
+    Stands in for the OCR process pool, running each job as it is submitted.
+    """
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def fake_extract_text(content, tesseract_cmd):
+    if content == b'unreadable':
+        raise RuntimeError("Tesseract failed")
+    return content.decode()
+
+
+@mock.patch('core.ocr.extract_text', fake_extract_text)
+@mock.patch('core.ocr_jobs.get_executor', ImmediateExecutor)
+class OCRJobTests(TestCase):
+    def setUp(self):
+        self.user = make_user('critic', role='critic')
+        self.storage = InMemoryStorage()
+        patcher = mock.patch('core.ocr_jobs.default_storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def stale_job(self, image, content=None):
+        if content is not None:
+            self.storage.save(image, ContentFile(content))
+        job = OCRJob.objects.create(user=self.user, image=image, content_hash=image)
+        OCRJob.objects.filter(id=job.id).update(updated_at=datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc))
+        return job
+
+    def test_job_finished_on_the_request_thread_keeps_its_connection(self):
+        job = OCRJob.objects.create(user=self.user, image='id.png', content_hash='hash')
+        # The future is done before its callback is added, so the callback runs right here
+        with mock.patch('core.ocr_jobs.connections') as connections:
+            ocr_jobs.enqueue(job.id, b'Press journalist ID-12345')
+        connections.close_all.assert_not_called()
+        job.refresh_from_db()
+        self.assertEqual(job.status, OCRJob.DONE)
+        self.assertTrue(job.verified)
+
+    def test_stale_jobs_continue_past_a_missing_image(self):
+        missing = self.stale_job('uploaded_images/missing.png')
+        readable = self.stale_job('uploaded_images/id.png', b'Press journalist ID-12345')
+        unreadable = self.stale_job('uploaded_images/bad.png', b'unreadable')
+
+        with self.assertLogs('core.ocr_jobs', 'ERROR'):
+            self.assertEqual(ocr_jobs.process_stale_jobs(timedelta(minutes=10)), (1, 2))
+        statuses = dict(OCRJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[missing.id], OCRJob.FAILED)
+        self.assertEqual(statuses[readable.id], OCRJob.DONE)
+        self.assertEqual(statuses[unreadable.id], OCRJob.FAILED)
+        self.assertEqual(OCRJob.objects.get(id=unreadable.id).error, "Tesseract failed")
+
+    def test_submitting_the_same_image_again_reuses_the_job(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = ocr_jobs.submit_job(self.user, ContentFile(b'Press journalist ID-12345', name='id.png'))
+        again = ocr_jobs.submit_job(self.user, ContentFile(b'Press journalist ID-12345', name='id.png'))
+        self.assertEqual(again.id, job.id)
+
+        other_user = make_user('other', role='critic')
+        copy = ocr_jobs.submit_job(other_user, ContentFile(b'Press journalist ID-12345', name='id.png'))
+        self.assertNotEqual(copy.id, job.id)
+        self.assertEqual(copy.status, OCRJob.DONE)
+        self.assertTrue(copy.passed)
+
+
+class LegacyReviewVoteTests(TestCase):
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TABLE core_review_voters (id integer PRIMARY KEY, review_id integer, customuser_id integer)"
+            )
+        game = make_game('Portal')
+        critic = make_user('critic', role='critic')
+        self.voters = [make_user(f'voter{i}') for i in range(4)]
+        self.review = Review.objects.create(game=game, user=critic, title='Great', rating=5, comment='Great')
+
+    def add_legacy_votes(self, helpful_votes, voters):
+        Review.objects.filter(id=self.review.id).update(helpful_votes=helpful_votes)
+        with connection.cursor() as cursor:
+            for voter in voters:
+                cursor.execute("INSERT INTO core_review_voters (review_id, customuser_id) VALUES (%s, %s)",
+                               [self.review.id, voter.id])
+
+    def test_votes_are_copied_keeping_the_net_count(self):
+        # Three up votes and one down vote
+        self.add_legacy_votes(2, self.voters)
+        call_command('copy_legacy_review_votes', stdout=StringIO())
+
+        values = list(ReviewVote.objects.filter(review=self.review).values_list('value', flat=True))
+        self.assertEqual(sorted(values), [ReviewVote.DOWN, ReviewVote.UP, ReviewVote.UP, ReviewVote.UP])
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.helpful_votes, self.review.upvotes, self.review.downvotes), (2, 3, 1))
+        self.assertGreater(self.review.helpfulness_score, 0)
+
+    def test_copying_again_keeps_newer_votes(self):
+        self.add_legacy_votes(-2, self.voters[:2])
+        call_command('copy_legacy_review_votes', stdout=StringIO())
+        self.review.cast_vote(self.voters[0], ReviewVote.UP)
+        call_command('copy_legacy_review_votes', stdout=StringIO())
+
+        self.assertEqual(ReviewVote.objects.filter(review=self.review).count(), 2)
+        self.review.refresh_from_db()
+        self.assertEqual((self.review.upvotes, self.review.downvotes), (1, 1))
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = replicas.ReplicaRouter()
+        token = replicas.set_read_alias('replica1')
+        self.addCleanup(replicas.reset_read_alias, token)
+
+    def test_reads_go_to_the_request_replica(self):
+        self.assertEqual(self.router.db_for_read(Game), 'replica1')
+
+    def test_reads_return_to_the_primary_after_a_write(self):
+        self.assertEqual(self.router.db_for_write(Game), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Game), DEFAULT_DB_ALIAS)
+
+    def test_primary_reads_and_sessions_stay_on_the_primary(self):
+        with replicas.primary_reads():
+            self.assertEqual(self.router.db_for_read(Game), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Game), 'replica1')
+        self.assertEqual(self.router.db_for_read(Session), DEFAULT_DB_ALIAS)
+
+
+@skipUnless(replicas.replica_aliases(), "Needs DB_REPLICAS, which tests mirror to the test database")
+class ReplicaPinningTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        game = make_game('Portal')
+        user = make_user('player')
+        self.comment = Comment.objects.create(game=game, user=user, comment='Great')
+        self.client.force_login(user)
+        self.url = f'/game/{game.id}/'
+
+    def replica_queries(self, request):
+        with ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in replicas.replica_aliases()
+            ]
+            response = request()
+        self.assertLess(response.status_code, 400)
+        return sum(len(context.captured_queries) for context in captured), response
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        queries, _ = self.replica_queries(lambda: self.client.get(self.url))
+        self.assertGreater(queries, 0)
+
+        queries, response = self.replica_queries(lambda: self.client.post(f'/comments/{self.comment.id}/like/'))
+        self.assertEqual(queries, 0)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+        queries, _ = self.replica_queries(lambda: self.client.get(self.url))
+        self.assertEqual(queries, 0)
+
+
+class BanTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.player = make_user('player')
+        self.other = make_user('other')
+
+    def logged_in_client(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_sessions_are_recorded_on_login_and_forgotten_on_logout(self):
+        client = self.logged_in_client(self.player)
+        session_key = client.session.session_key
+        self.assertTrue(UserSession.objects.filter(user=self.player, session_key=session_key).exists())
+        client.logout()
+        self.assertFalse(UserSession.objects.filter(session_key=session_key).exists())
+
+    def test_ban_ends_every_session_of_the_user_only(self):
+        clients = [self.logged_in_client(self.player), self.logged_in_client(self.player)]
+        other_client = self.logged_in_client(self.other)
+
+        ban(self.player)
+
+        self.assertFalse(UserSession.objects.filter(user=self.player).exists())
+        for client in clients:
+            self.assertFalse(Session.objects.filter(session_key=client.session.session_key).exists())
+            response = client.get(f'/account/{self.player.id}/')
+            self.assertEqual(response.status_code, 302)
+            self.assertNotIn('_auth_user_id', client.session)
+        self.assertEqual(other_client.get(f'/account/{self.other.id}/').status_code, 200)
+
+    def test_banned_user_with_a_live_session_is_logged_out(self):
+        client = self.logged_in_client(self.player)
+        # Banned without going through ban(), so the session survives, and seen
+        # once the cached ban state has expired
+        CustomUser.objects.filter(id=self.player.id).update(banned=True)
+        cache.clear()
+
+        response = client.get(f'/account/{self.player.id}/')
+        self.assertRedirects(response, '/login/', fetch_redirect_response=False)
+        self.assertNotIn('_auth_user_id', client.session)
+
+    def test_ban_state_is_cached(self):
+        cache.clear()  # Saving the user cached it already
+        with self.assertNumQueries(1):
+            self.assertFalse(is_banned(self.player.id))
+        with self.assertNumQueries(0):
+            self.assertFalse(is_banned(self.player.id))
+        ban(self.player)
+        with self.assertNumQueries(0):
+            self.assertTrue(is_banned(self.player.id))
+
+
+class CursorPaginatorTests(TestCase):
+    def setUp(self):
+        # Pairs of games share a release date, so the id has to break the ties
+        self.games = [
+            make_game(f'Game {i}', release_date=datetime.date(2020, 1, 1) + timedelta(days=i // 2)) for i in range(7)
+        ]
+        self.paginator = CursorPaginator(Game.objects.all(), 3, ('-release_date', '-id'))
+        self.expected = sorted(self.games, key=lambda game: (game.release_date, game.id), reverse=True)
+
+    def titles(self, page):
+        return [game.title for game in page]
+
+    def test_pages_forward_and_back(self):
+        first = self.paginator.get_page()
+        self.assertEqual(list(first), self.expected[:3])
+        self.assertFalse(first.has_previous())
+
+        second = self.paginator.get_page(first.next_cursor)
+        self.assertEqual(list(second), self.expected[3:6])
+        self.assertTrue(second.has_previous())
+
+        last = self.paginator.get_page(second.next_cursor)
+        self.assertEqual(list(last), self.expected[6:])
+        self.assertFalse(last.has_next())
+
+        back = self.paginator.get_page(last.previous_cursor)
+        self.assertEqual(self.titles(back), self.titles(second))
+        self.assertEqual(self.titles(self.paginator.get_page(back.previous_cursor)), self.titles(first))
+        self.assertFalse(self.paginator.get_page(back.previous_cursor).has_previous())
+
+    def test_rows_added_before_the_cursor_do_not_shift_the_next_page(self):
+        first = self.paginator.get_page()
+        make_game('Newest', release_date=datetime.date(2030, 1, 1))
+        self.assertEqual(list(self.paginator.get_page(first.next_cursor)), self.expected[3:6])
+
+    def test_invalid_cursors_give_the_first_page(self):
+        for cursor in ('not-a-cursor', 'W10', '!!!'):
+            self.assertEqual(list(self.paginator.get_page(cursor)), self.expected[:3], cursor)
+
+    def test_views_accept_cursors(self):
+        cache.clear()
+        first = self.paginator.get_page()
+        response = self.client.get('/', {'cursor': first.next_cursor})
+        self.assertEqual(list(response.context['latest_games'])[:3], self.expected[3:6])
+
+
+class LikeTests(TestCase):
+    def setUp(self):
+        self.user = make_user('player')
+        self.comment = Comment.objects.create(game=make_game('Portal'), user=make_user('author'), comment='Great')
+
+    def like_count(self):
+        self.comment.refresh_from_db()
+        return self.comment.like_count
+
+    def test_toggle_like_likes_and_unlikes(self):
+        self.assertEqual(toggle_like(self.user, self.comment), (True, 1))
+        self.assertEqual(self.like_count(), 1)
+        self.assertEqual(toggle_like(self.user, self.comment), (False, 0))
+        self.assertEqual(self.like_count(), 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_like_inserted_concurrently_is_not_counted_twice(self):
+        toggle_like(self.user, self.comment)
+        # Another request's like lands between this one's delete and insert
+        with mock.patch.object(Like.objects, 'filter') as like_filter:
+            like_filter.return_value.delete.return_value = (0, {})
+            self.assertEqual(toggle_like(self.user, self.comment), (True, 1))
+        self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(self.like_count(), 1)
+
+    def test_like_comment_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(f'/comments/{self.comment.id}/like/')
+        self.assertEqual(response.json(), {'liked': True, 'like_count': 1})
+
+    def test_reconcile_like_counts_repairs_drifted_counts(self):
+        other_user = make_user('other')
+        Like.objects.bulk_create([Like(user=self.user, comment=self.comment), Like(user=other_user, comment=self.comment)])
+        Comment.objects.filter(id=self.comment.id).update(like_count=7)
+
+        out = StringIO()
+        call_command('reconcile_like_counts', '--dry-run', stdout=out)
+        self.assertIn('1 comments with a wrong like count', out.getvalue())
+        self.assertEqual(self.like_count(), 7)
+
+        call_command('reconcile_like_counts', stdout=StringIO())
+        self.assertEqual(self.like_count(), 2)
+
+
+class MediaServingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.path = os.path.join(self.root, 'trailer.mp4')
+        with open(self.path, 'wb') as file:
+            file.write(bytes(range(100)))
+        self.factory = RequestFactory()
+
+    def get(self, headers=None):
+        response = media_response(self.factory.get('/media/trailer.mp4', headers=headers), self.path)
+        self.addCleanup(response.close)
+        return response
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=90-500', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+        self.assertIsNone(parse_range('', 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+        self.assertFalse(parse_range('bytes=100-', 100))
+        self.assertFalse(parse_range('bytes=9-3', 100))
+        self.assertFalse(parse_range('bytes=-0', 100))
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(self.content(response), bytes(range(100)))
+
+    def test_partial_content(self):
+        response = self.get({'Range': 'bytes=10-19'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.content(response), bytes(range(10, 20)))
+
+        response = self.get({'Range': 'bytes=-5'})
+        self.assertEqual(response['Content-Range'], 'bytes 95-99/100')
+        self.assertEqual(self.content(response), bytes(range(95, 100)))
+
+    def test_unsatisfiable_range(self):
+        response = self.get({'Range': 'bytes=200-'})
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    def test_not_modified(self):
+        response = self.get({'If-Modified-Since': http_date(os.stat(self.path).st_mtime + 60)})
+        self.assertEqual(response.status_code, 304)
+
+    def test_serve_media_stays_in_the_media_root(self):
+        from game_reviews.local_storage import LocalMediaFileStorage
+
+        with mock.patch('core.views.default_storage', LocalMediaFileStorage(location=self.root)):
+            response = views.serve_media(self.factory.get('/media/trailer.mp4'), 'trailer.mp4')
+            self.addCleanup(response.close)
+            self.assertEqual(response.status_code, 200)
+            for path in ('../etc/passwd', 'missing.mp4'):
+                with self.assertRaises(Http404):
+                    views.serve_media(self.factory.get(f'/media/{path}'), path)
+
+
+def png_image(width=400, height=300):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'navy').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class GameUploadTests(TestCase):
+    def setUp(self):
+        from game_reviews.local_storage import LocalMediaFileStorage
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # The filesystem backend stands in for the bucket
+        self.storage = LocalMediaFileStorage(location=directory.name)
+        patcher = mock.patch('core.forms.default_storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def game_form(self, files):
+        data = {
+            'title': 'Portal', 'description': 'Puzzles', 'release_date': '2007-10-10', 'developer': 'Valve',
+            'publisher': 'Valve', 'genre': 'Puzzle', 'age_rating': 12,
+        }
+        form = GameForm(data, files)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def test_image_video_and_file_are_uploaded_in_parallel(self):
+        upload_threads = set()
+        upload = self.storage.upload
+
+        def record_thread(*args):
+            upload_threads.add(threading.current_thread())
+            return upload(*args)
+
+        form = self.game_form({
+            'image': SimpleUploadedFile('cover.png', png_image(), content_type='image/png'),
+            'video': SimpleUploadedFile('trailer.mp4', b'video' * 1000, content_type='video/mp4'),
+            'file': SimpleUploadedFile('manual.pdf', b'manual', content_type='application/pdf'),
+        })
+        with mock.patch.object(self.storage, 'upload', record_thread):
+            game = form.save()
+
+        self.assertNotIn(threading.current_thread(), upload_threads)
+        for field, folder in (('image', 'images'), ('video', 'videos'), ('file', 'files')):
+            name = getattr(game, field).name
+            self.assertTrue(name.startswith(f"{settings.GS_LOCATION}/games/{folder}/"), name)
+            self.assertTrue(self.storage.exists(name), name)
+        with self.storage.open(game.video.name) as video:
+            self.assertEqual(video.read(), b'video' * 1000)
+        thumbnails = [name for sizes in game.image_derivatives.values() for name in sizes.values()]
+        self.assertTrue(thumbnails)
+        self.assertTrue(all(self.storage.exists(name) for name in thumbnails))
+
+    def test_rejected_extension_fails_the_save(self):
+        form = self.game_form({'video': SimpleUploadedFile('trailer.exe', b'video', content_type='video/mp4')})
+        with self.assertLogs('core.forms', 'ERROR'), self.assertRaises(ValueError):
+            form.save()
+        self.assertFalse(Game.objects.exists())
+
+
+@skipUnless(os.environ.get('STORAGE_EMULATOR_HOST') and settings.GS_BUCKET_NAME,
+            "Needs a Cloud Storage emulator (STORAGE_EMULATOR_HOST) and GS_BUCKET_NAME")
+@override_settings(GS_UPLOAD_CHUNK_SIZE=256 * 1024)
+class GCSEmulatorUploadTests(SimpleTestCase):
+    def test_upload_streams_the_file_to_the_bucket(self):
+        from game_reviews import gcloud
+
+        self.assertIs(gcloud.get_client(), gcloud.get_client())
+        content = os.urandom(1024 * 1024)
+        upload = SimpleUploadedFile('trailer.mp4', content, content_type='video/mp4')
+        url = gcloud.upload_file(upload, 'tests/trailer.mp4', 'video/mp4')
+
+        blob = gcloud.get_bucket().blob('tests/trailer.mp4')
+        self.assertTrue(url.endswith('/tests/trailer.mp4'))
+        self.assertEqual(blob.download_as_bytes(), content)
@@ -0,0 +1,54 @@
+"""
+Thumbnails of game images.
+
+This module does not import Django, so its functions can run in the worker
+processes of the generate_thumbnails command without setting Django up there.
+Pillow is imported on first use, so importing the format table stays cheap.
+"""
+import io
+
+THUMBNAIL_WIDTHS = (320, 640)  # Card width and its 2x version for high density screens
+THUMBNAIL_FORMATS = {
+    # format: (Pillow format, file extension, content type, save options)
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def _flatten(image):
+    from PIL import Image
+
+    # JPEG has no alpha channel, so transparent images are put on white
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_thumbnails(source, widths=THUMBNAIL_WIDTHS):
+    """
+    Resizes an image (bytes or a file object) to each width and encodes it in
+    every THUMBNAIL_FORMATS format. Returns {(format, width): bytes}. Images are
+    never upscaled: widths above the original's give one thumbnail at its width.
+    """
+    from PIL import Image, ImageOps
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    source.seek(0)
+    image = Image.open(source)
+    largest = max(widths)
+    # JPEGs are decoded directly at a fraction of their size; square so rotation keeps enough pixels
+    image.draft('RGB', (largest, largest))
+    image = _flatten(ImageOps.exif_transpose(image))
+
+    thumbnails = {}
+    for width in sorted({min(width, image.width) for width in widths}):
+        resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for format_name, (pillow_format, extension, content_type, options) in THUMBNAIL_FORMATS.items():
+            output = io.BytesIO()
+            resized.save(output, pillow_format, **options)
+            thumbnails[(format_name, width)] = output.getvalue()
+    return thumbnails
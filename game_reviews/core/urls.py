@@ -1,4 +1,5 @@
 # core/urls.py
+from django.conf import settings
 from django.urls import path
 from . import views
 
@@ -8,7 +9,11 @@ urlpatterns = [
     path('login/', views.user_login, name='login'),
     path('logout/', views.user_logout, name='logout'),
     path('account/<int:user_id>/', views.account_details, name='account_details'),
-    path('game/<int:game_id>/', views.game_detail, name='game_detail'),
+    path('game/<int:game_id>/', views.game_detail_async if settings.ASYNC_GAME_DETAIL else views.game_detail,
+         name='game_detail'),
+    path('game/<int:game_id>/fragments/steam/', views.game_steam_fragment, name='game_steam_fragment'),
+    path('game/<int:game_id>/fragments/reviews/', views.game_reviews_fragment, name='game_reviews_fragment'),
+    path('game/<int:game_id>/comments/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
     path('games/', views.game_list, name='game_list'),
     path('game/create/', views.create_game, name='create_game'),
     path('game/edit/<int:game_id>', views.edit_game, name='edit_game'),
@@ -18,11 +23,13 @@ urlpatterns = [
     path('critic/delete/', views.delete_critic, name='delete_critic'),
     path('critic/delete_confirm/', views.delete_critic_confirm, name='delete_critic_confirm'), 
     path('critic/verify/', views.verify_critic, name='verify_critic'), 
+    path('critic/verify/jobs/<int:job_id>/', views.ocr_job_status, name='ocr_job_status'),
     path('critic/dashboard/', views.critic_dashboard, name='critic_dashboard'),
     path('game/<int:game_id>/all_reviews/', views.all_reviews, name='all_reviews'),
     path('game/<int:game_id>/create_review/', views.create_review, name='create_review'),
     path('adminas/user_list/', views.user_list, name='user_list'),
     path('adminas/update_role/<int:user_id>/', views.update_user_role, name='update_user_role'),
+    path('adminas/metrics/', views.request_metrics, name='request_metrics'),
     path('upload/', views.upload_file, name='upload_file'),
     path('comments/edit/<int:comment_id>/', views.edit_comment, name='edit_comment'),
     path('comments/<int:comment_id>/like/', views.like_comment, name='like_comment'),
@@ -36,3 +43,8 @@ urlpatterns = [
     path('game/delete/<int:game_id>/', views.delete_game, name='delete_game'),
     path('game/toggle_visibility/<int:game_id>/', views.toggle_game_visibility, name='toggle_game_visibility'),
 ]
+
+if settings.STORAGE_BACKEND == 'local':
+    urlpatterns.append(
+        path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", views.serve_media, name='serve_media')
+    )
@@ -1,12 +1,18 @@
-import pytesseract
-from PIL import Image
-import re
-import requests
+import asyncio
+import logging
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.files.storage import default_storage
+from django.db import connections
 from django.utils import timezone
 
-# Manually specify the path to Tesseract OCR
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+from .instrumentation import timed
+
+logger = logging.getLogger(__name__)
 
 
 def upload_to_storage(file):
@@ -15,7 +21,8 @@ def upload_to_storage(file):
     """
     try:
         # Save the file to the storage backend
-        file_path = default_storage.save(file.name, file)
+        with timed('storage'):
+            file_path = default_storage.save(file.name, file)
         return default_storage.path(file_path)
     except Exception as e:
         raise ValueError(f"Failed to upload file: {e}")
@@ -27,70 +34,166 @@ def upload_image_to_storage(file):
     """
     try:
         # Save the file to the storage backend
-        file_path = default_storage.save(f"uploaded_images/{timezone.now().strftime('%Y%m%d%H%M%S')}_{file.name}", file)
+        with timed('storage'):
+            file_path = default_storage.save(f"uploaded_images/{timezone.now().strftime('%Y%m%d%H%M%S')}_{file.name}", file)
         absolute_path = default_storage.path(file_path)  # Return the full file path
-        print("DEBUG: File uploaded to:", absolute_path)  # Debug line to confirm file path
+        logger.debug("File uploaded to: %s", absolute_path)
         return absolute_path
     except Exception as e:
         raise ValueError(f"Failed to upload image: {e}")
 
-def verify_id_image(image_path):
+
+STEAMSPY_UNAVAILABLE = {
+    "positive_reviews": "Unavailable",
+    "negative_reviews": "Unavailable",
+    "total_reviews": "Unavailable",
+    "overall_score": "Unavailable"
+}
+
+
+def _steamspy_url(app_id):
+    return f"{settings.STEAMSPY_API_URL}?request=appdetails&appid={app_id}"
+
+
+def _parse_steamspy_info(review_data):
+    positive_reviews = review_data.get("positive", 0)
+    negative_reviews = review_data.get("negative", 0)
+    total_reviews = positive_reviews + negative_reviews
+    overall_score = (positive_reviews / total_reviews) * 100 if total_reviews > 0 else 0
+
+    return {
+        "positive_reviews": positive_reviews,
+        "negative_reviews": negative_reviews,
+        "total_reviews": total_reviews,
+        "overall_score": f"{overall_score:.2f}%"
+    }
+
+
+def fetch_steamspy_info(app_id):
     """
-    Verifies an uploaded image using Tesseract OCR to detect keywords and ID patterns.
+    Fetches game details from SteamSpy API, including review counts and overall score.
+    Returns (info, ok) where ok is False when SteamSpy could not be reached.
     """
+    import requests  # Imported on first use, like httpx below, to keep worker start fast
+
     try:
-        # Extract text from the image
-        text = pytesseract.image_to_string(Image.open(image_path))
-        print("DEBUG: Extracted OCR Text:\n", text)  # Debugging log
-        
-        # Normalize the extracted text (lowercase, remove extra spaces)
-        clean_text = " ".join(text.lower().split())
+        with timed('http'):
+            steamspy_response = requests.get(_steamspy_url(app_id), timeout=settings.STEAMSPY_TIMEOUT)
+        if steamspy_response.status_code != 200:
+            logger.warning("Failed to retrieve review data from SteamSpy for app %s.", app_id)
+            return dict(STEAMSPY_UNAVAILABLE), False
+        review_data = steamspy_response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Failed to reach SteamSpy for app %s: %s", app_id, e)
+        return dict(STEAMSPY_UNAVAILABLE), False
 
-        # Define required keywords and patterns
-        required_keywords = ['press', 'journalist', 'photographer']
-        id_pattern = r'id[-\s]?\w{4,}'  # Flexible ID pattern: ID, ID-CARD, etc.
+    return _parse_steamspy_info(review_data), True
 
-        # Verify keywords and ID pattern
-        keyword_verified = any(keyword in clean_text for keyword in required_keywords)
-        id_verified = re.search(id_pattern, clean_text)
 
-        confidence = 0.9 if keyword_verified and id_verified else 0.5
-        return {'verified': keyword_verified and id_verified, 'confidence': confidence, 'text': text}
+_http_clients = weakref.WeakKeyDictionary()
 
-    except Exception as e:
-        print("Error during OCR verification:", e)
-        return {'verified': False, 'confidence': 0.0, 'text': ''}
 
-    
+def _async_http_client():
+    import httpx
+
+    # httpx clients belong to one event loop; reusing it keeps connections and the TLS setup
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = _http_clients[loop] = httpx.AsyncClient(timeout=settings.STEAMSPY_TIMEOUT)
+    return client
+
+
+async def afetch_steamspy_info(app_id):
+    """
+    Async version of fetch_steamspy_info, using httpx.
+    """
+    import httpx
+
+    try:
+        with timed('http'):
+            steamspy_response = await _async_http_client().get(_steamspy_url(app_id))
+        if steamspy_response.status_code != 200:
+            logger.warning("Failed to retrieve review data from SteamSpy for app %s.", app_id)
+            return dict(STEAMSPY_UNAVAILABLE), False
+        review_data = steamspy_response.json()
+    except (httpx.HTTPError, ValueError) as e:
+        logger.warning("Failed to reach SteamSpy for app %s: %s", app_id, e)
+        return dict(STEAMSPY_UNAVAILABLE), False
+
+    return _parse_steamspy_info(review_data), True
+
+
+def _steamspy_cache_key(app_id):
+    return f"steamspy:{app_id}"
+
 
+def _steamspy_cache_entry(info, ok):
+    ttl = settings.STEAMSPY_CACHE_TTL if ok else settings.STEAMSPY_NEGATIVE_TTL
+    # Keep the entry around past its TTL so it can be served while it is refreshed
+    return {'info': info, 'fresh_until': time.time() + ttl}, ttl + settings.STEAMSPY_STALE_TTL
+
+
+def _store_steamspy_info(app_id):
+    """
+    Fetches SteamSpy data and stores it in the cache together with its freshness deadline.
+    Failed lookups are cached as well, but for STEAMSPY_NEGATIVE_TTL seconds only.
+    """
+    info, ok = fetch_steamspy_info(app_id)
+    entry, timeout = _steamspy_cache_entry(info, ok)
+    cache.set(_steamspy_cache_key(app_id), entry, timeout)
+    return info
+
+
+def _refresh_steamspy_info(app_id):
+    try:
+        _store_steamspy_info(app_id)
+    finally:
+        cache.delete(f"{_steamspy_cache_key(app_id)}:refreshing")
+        connections.close_all()
 
 
 def get_game_info(app_id):
     """
-    Fetches game details from SteamSpy API, including review counts and overall score.
+    Returns SteamSpy stats for a game from the cache.
+
+    Only the very first lookup of an app id waits on SteamSpy. Once an entry is older
+    than STEAMSPY_CACHE_TTL it is still served, while a single background thread
+    fetches a fresh copy.
     """
-    steamspy_url = f"https://steamspy.com/api.php?request=appdetails&appid={app_id}"
-    steamspy_response = requests.get(steamspy_url)
+    if app_id is None:
+        return dict(STEAMSPY_UNAVAILABLE)
 
-    if steamspy_response.status_code != 200:
-        print("Failed to retrieve review data from SteamSpy.")
-        return {
-            "positive_reviews": "Unavailable",
-            "negative_reviews": "Unavailable",
-            "total_reviews": "Unavailable",
-            "overall_score": "Unavailable"
-        }
+    entry = cache.get(_steamspy_cache_key(app_id))
+    if entry is None:
+        return _store_steamspy_info(app_id)
 
-    review_data = steamspy_response.json()
+    if entry['fresh_until'] < time.time():
+        # cache.add is atomic, so only one request starts the refresh
+        if cache.add(f"{_steamspy_cache_key(app_id)}:refreshing", True, settings.STEAMSPY_TIMEOUT * 2):
+            threading.Thread(target=_refresh_steamspy_info, args=(app_id,), daemon=True).start()
 
-    positive_reviews = review_data.get("positive", 0)
-    negative_reviews = review_data.get("negative", 0)
-    total_reviews = positive_reviews + negative_reviews
-    overall_score = (positive_reviews / total_reviews) * 100 if total_reviews > 0 else 0
+    return entry['info']
 
-    return {
-        "positive_reviews": positive_reviews,
-        "negative_reviews": negative_reviews,
-        "total_reviews": total_reviews,
-        "overall_score": f"{overall_score:.2f}%"
-    }
+
+async def aget_game_info(app_id):
+    """
+    Async version of get_game_info: a first lookup waits on SteamSpy without
+    blocking the event loop. Stale entries are refreshed by the same background
+    thread as in get_game_info.
+    """
+    if app_id is None:
+        return dict(STEAMSPY_UNAVAILABLE)
+
+    entry = await cache.aget(_steamspy_cache_key(app_id))
+    if entry is None:
+        info, ok = await afetch_steamspy_info(app_id)
+        entry, timeout = _steamspy_cache_entry(info, ok)
+        await cache.aset(_steamspy_cache_key(app_id), entry, timeout)
+        return info
+
+    if entry['fresh_until'] < time.time():
+        if await cache.aadd(f"{_steamspy_cache_key(app_id)}:refreshing", True, settings.STEAMSPY_TIMEOUT * 2):
+            threading.Thread(target=_refresh_steamspy_info, args=(app_id,), daemon=True).start()
+
+    return entry['info']
@@ -1,28 +1,50 @@
+import asyncio
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
 from django.db.models import Q, Avg
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib import messages
-from django.http import HttpResponseForbidden, JsonResponse
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_safe
+from django.urls import reverse
 from .forms import CustomUserCreationForm, GameForm, CustomUserEditForm, CommentForm, ReviewForm, RoleChangeForm, \
     FileUploadForm
-from .models import Game, Review, Comment, CustomUser, Like
-from .utils import get_game_info, upload_to_storage
-import requests
+from .models import Game, Review, Comment, CustomUser, Like, ReviewVote, OCRJob
+from .utils import aget_game_info, upload_to_storage
+from .comments import load_comment_tree, load_replies, parse_comments_per_page, toggle_like
+from .search import search_games
+from .pagination import paginate
+from .steam import import_steam_reviews
+from .instrumentation import instrumented_connections, metrics_snapshot
+from .bans import ban
+from .media import media_response
+from .ocr_jobs import submit_job as submit_ocr_job
+from .page_cache import cache_anonymous_page, stats as page_cache_stats
+from .replicas import replica_lag
 from django.contrib.auth.models import User
 from django.db.utils import IntegrityError
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from .utils import upload_image_to_storage, verify_id_image
 
 
 from django.core.paginator import Paginator
 
+logger = logging.getLogger(__name__)
+
+
+@cache_anonymous_page('games')
 def home(request):
-    latest_games = Game.objects.filter(hidden=False).order_by('-release_date')  # Fetch latest games
-    paginator = Paginator(latest_games, 5)  # Show 5 games per page
-    page_number = request.GET.get('page')
-    games_page = paginator.get_page(page_number)
+    latest_games = Game.objects.filter(hidden=False)  # Fetch latest games
+    games_page = paginate(request, latest_games, 5, ('-release_date', '-id'))  # Show 5 games per page
 
     context = {
         'latest_games': games_page,
@@ -149,54 +171,68 @@ def delete_critic_confirm(request):
 def verify_critic(request):
     """
     Verifies the critic's identity using a password and uploaded work ID.
+    The OCR runs in the background; the page then polls the job's status.
     """
     if request.user.role != 'critic':
         return HttpResponseForbidden("You are not authorized to verify this profile.")
 
-    extracted_text = ""  # Initialize variable to hold extracted text
-
     if request.method == 'POST':
+        # Step 1: Verify the password
+        password = request.POST.get('password')
+        user = authenticate(username=request.user.username, password=password)
+
+        if user is None:
+            messages.error(request, "Incorrect password. Please try again.")
+            return render(request, 'core/verify_critic.html')
+
+        # Step 2: Handle the file upload
+        uploaded_file = request.FILES.get('file')
+        if not uploaded_file:
+            messages.error(request, "Please upload an image of your work ID.")
+            return render(request, 'core/verify_critic.html')
+
+        # Step 3: Queue the OCR-based verification
         try:
-            # Step 1: Verify the password
-            password = request.POST.get('password')
-            user = authenticate(username=request.user.username, password=password)
-
-            if user is None:
-                messages.error(request, "Incorrect password. Please try again.")
-                return render(request, 'core/verify_critic.html', {'extracted_text': extracted_text})
-
-            # Step 2: Handle the file upload
-            uploaded_file = request.FILES.get('file')
-            if not uploaded_file:
-                messages.error(request, "Please upload an image of your work ID.")
-                return render(request, 'core/verify_critic.html', {'extracted_text': extracted_text})
-
-            # Save the uploaded file using the new function
-            file_path = upload_image_to_storage(uploaded_file)
-            print(f"File saved at: {file_path}")
-
-            # Step 3: Run OCR-based verification
-            result = verify_id_image(file_path)
-            extracted_text = result['text']  # Capture extracted text for debugging
-            print(f"Verification Result: {result}")
-
-            # Step 4: Provide feedback
-            if result['verified'] and result['confidence'] >= 0.8:
-                messages.success(request, f"Verification successful! Confidence: {result['confidence']:.2f}")
-            else:
-                messages.error(request, f"Verification failed. Confidence: {result['confidence']:.2f}")
+            job = submit_ocr_job(request.user, uploaded_file)
         except Exception as e:
-            print(f"Error in verify_critic view: {e}")
+            logger.exception("Error in verify_critic view: %s", e)
             messages.error(request, "An unexpected error occurred. Please try again.")
+            return render(request, 'core/verify_critic.html')
+        return redirect(f"{reverse('verify_critic')}?job={job.id}")
+
+    # Step 4: Show the job's progress and result
+    job = None
+    job_id = request.GET.get('job', '')
+    if job_id.isdigit():
+        job = OCRJob.objects.filter(id=job_id, user=request.user).first()
+    return render(request, 'core/verify_critic.html', {'job': job})
+
 
-    return render(request, 'core/verify_critic.html', {'extracted_text': extracted_text})
+@login_required
+def ocr_job_status(request, job_id):
+    """
+    Returns the state of one of the critic's OCR verification jobs, polled by verify_critic.
+    """
+    job = get_object_or_404(OCRJob, id=job_id, user=request.user)
+    return JsonResponse({
+        'status': job.status,
+        'finished': job.finished,
+        'passed': job.passed,
+        'confidence': job.confidence,
+        'text': job.text,
+    })
 
 
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
+@cache_anonymous_page('game:{game_id}')
 def game_detail(request, game_id):
+    """
+    The game's page. The SteamSpy stats, the latest reviews and replies past the
+    first few are not part of it: the page loads them from the fragment views
+    below, so it does not wait on SteamSpy.
+    """
     game = get_object_or_404(Game, id=game_id)
-    steam_info = get_game_info(game.steam_app_id)
 
     # Fetch base game or DLCs
     if game.parent_game:
@@ -206,44 +242,9 @@ def game_detail(request, game_id):
         parent_game = None
         dlcs = Game.objects.filter(parent_game=game)
 
-    # Fetch the latest two reviews
-    latest_reviews = game.reviews.order_by('-created_at')[:2]
-
-    # User and critic check
-    is_critic = request.user.is_authenticated and request.user.role == 'critic'
-    user_has_reviewed = False
-    user_review = None
-    if is_critic:
-        try:
-            user_review = Review.objects.get(game=game, user=request.user)
-            user_has_reviewed = True
-        except Review.DoesNotExist:
-            pass
-
-    # Comments pagination (number of comments per page set by query parameter)
-    comments_per_page = request.GET.get('comments_per_page', 5)  # Default to 10
-    try:
-        comments_per_page = int(comments_per_page)
-    except ValueError:
-        comments_per_page = 5
-
-    top_level_comments = Comment.objects.filter(game=game, parent__isnull=True).select_related('user')
-    paginator = Paginator(top_level_comments, comments_per_page)
-
-    page = request.GET.get('page')
-    try:
-        comments = paginator.page(page)
-    except PageNotAnInteger:
-        comments = paginator.page(1)
-    except EmptyPage:
-        comments = paginator.page(paginator.num_pages)
-
-    # Paginate replies for each comment (limit to 5 replies per page)
-    paginated_replies = {}
-    for comment in comments:
-        replies = comment.replies.all()
-        reply_paginator = Paginator(replies, 3)
-        paginated_replies[comment.id] = reply_paginator.page(1)  # Show first page of replies by default
+    # Comments pagination (number of comments per page set by query parameter, capped)
+    comments_per_page = parse_comments_per_page(request.GET.get('comments_per_page'))
+    comments, paginated_replies, liked_comment_ids = load_comment_tree(request, game, comments_per_page)
 
     # Comment form
     comment_form = CommentForm()
@@ -262,19 +263,138 @@ def game_detail(request, game_id):
 
     context = {
         'game': game,
-        'steam_info': steam_info,
-        'latest_reviews': latest_reviews,
-        'is_critic': is_critic,
-        'user_has_reviewed': user_has_reviewed,
-        'user_review': user_review,
+        'dlcs': dlcs,
         'comments': comments,  # Paginated top-level comments
         'comment_form': comment_form,
-        'paginated_replies': paginated_replies,  # First page of replies for each comment
+        'paginated_replies': paginated_replies,  # First replies for each comment
+        'liked_comment_ids': liked_comment_ids,  # Comments on this page the user has liked
         'comments_per_page': comments_per_page,
     }
     return render(request, 'core/game.html', context)
 
 
+async def _list(queryset):
+    return [item async for item in queryset]
+
+
+async def _empty():
+    return []
+
+
+async def _false():
+    return False
+
+
+async def _run_in_own_connection(func, *args):
+    # Async ORM queries of a request share one connection and run one at a time;
+    # a separate thread has its own connection, so func's queries run alongside
+    def run():
+        close_old_connections()
+        try:
+            with instrumented_connections():
+                return func(*args)
+        finally:
+            close_old_connections()
+    return await sync_to_async(run, thread_sensitive=False)()
+
+
+@cache_anonymous_page('game:{game_id}')
+async def game_detail_async(request, game_id):
+    """
+    Async version of game_detail, served when ASYNC_GAME_DETAIL is set. Unlike
+    the sync view it renders the SteamSpy stats and the latest reviews into the
+    page itself: SteamSpy, the DLCs, the latest reviews, the critic's own review
+    and the comments are loaded concurrently, so the page waits for the slowest
+    of them rather than for all of them in turn.
+    """
+    if request.method == 'POST':
+        # New comments are handled by the sync view
+        return await sync_to_async(game_detail)(request, game_id=game_id)
+
+    game = await aget_object_or_404(Game.objects.select_related('parent_game'), id=game_id)
+    request.user = await request.auser()
+    comments_per_page = parse_comments_per_page(request.GET.get('comments_per_page'))
+    is_critic = request.user.is_authenticated and request.user.role == 'critic'
+
+    # A DLC has no DLCs of its own
+    dlcs_query = _list(Game.objects.filter(parent_game=game)) if not game.parent_game_id else _empty()
+    own_review_query = (Review.objects.filter(game=game, user=request.user).aexists() if is_critic
+                        else _false())
+    steam_info, dlcs, latest_reviews, user_has_reviewed, (comments, paginated_replies, liked_comment_ids) = (
+        await asyncio.gather(
+            aget_game_info(game.steam_app_id),
+            dlcs_query,
+            _list(game.reviews.select_related('user').order_by(*Review.HELPFUL_ORDERING)[:2]),
+            own_review_query,
+            _run_in_own_connection(load_comment_tree, request, game, comments_per_page),
+        )
+    )
+
+    context = {
+        'game': game,
+        'dlcs': dlcs,
+        'comments': comments,
+        'comment_form': CommentForm(),
+        'paginated_replies': paginated_replies,
+        'liked_comment_ids': liked_comment_ids,
+        'comments_per_page': comments_per_page,
+        'fragments_inline': True,
+        'steam_info': steam_info,
+        'latest_reviews': latest_reviews,
+        'is_critic': is_critic,
+        'user_has_reviewed': user_has_reviewed,
+    }
+    return await sync_to_async(render)(request, 'core/game.html', context)
+
+
+# Parts of the game page that it loads after rendering. Each returns the part's
+# HTML as JSON and is cached on its own like a page.
+
+@require_safe
+@cache_anonymous_page('game:{game_id}')
+async def game_steam_fragment(request, game_id):
+    """
+    SteamSpy stats of a game. The first lookup of a game waits on SteamSpy without
+    holding up the rest of its page, and, being async, without holding a worker
+    thread while it waits.
+    """
+    game = await aget_object_or_404(Game, id=game_id)
+    steam_info = await aget_game_info(game.steam_app_id)
+    html = await sync_to_async(render_to_string)('core/_steam_info.html', {'steam_info': steam_info}, request)
+    return JsonResponse({'html': html, 'steam_info': steam_info})
+
+
+@require_safe
+@cache_anonymous_page('game:{game_id}')
+def game_reviews_fragment(request, game_id):
+    """
+    The most helpful reviews of a game (the latest ones while nobody has voted),
+    with the critic's "Write a Review" button.
+    """
+    game = get_object_or_404(Game, id=game_id)
+    latest_reviews = game.reviews.select_related('user').order_by(*Review.HELPFUL_ORDERING)[:2]
+    is_critic = request.user.is_authenticated and request.user.role == 'critic'
+    context = {
+        'game': game,
+        'latest_reviews': latest_reviews,
+        'is_critic': is_critic,
+        'user_has_reviewed': is_critic and Review.objects.filter(game=game, user=request.user).exists(),
+    }
+    return JsonResponse({'html': render_to_string('core/_latest_reviews.html', context, request)})
+
+
+@require_safe
+@cache_anonymous_page('game:{game_id}')
+def comment_replies(request, game_id, comment_id):
+    """
+    The next page of a comment's replies after ?cursor, for "Load more replies".
+    """
+    comment = get_object_or_404(Comment, id=comment_id, game_id=game_id, parent__isnull=True)
+    replies, liked_comment_ids = load_replies(request, comment)
+    html = render_to_string('core/_replies.html', {'replies': replies, 'liked_comment_ids': liked_comment_ids}, request)
+    return JsonResponse({'html': html, 'next_cursor': replies.next_cursor})
+
+
 
 
 
@@ -325,6 +445,10 @@ def delete_game(request, game_id):
     return render(request, 'core/delete_game_confirm.html', {'game': game})
 
 
+GAME_SORT_FIELDS = ('title', 'average_rating', 'release_date')
+
+
+@cache_anonymous_page('games')
 def game_list(request):
     query = request.GET.get('q', '')  # Search query
     sort = request.GET.get('sort', 'title')  # Sorting field, default is 'title'
@@ -335,29 +459,20 @@ def game_list(request):
         games = Game.objects.all()  # Admins and moderators can see all games
     else:
         games = Game.objects.filter(hidden=False)  # Other users see only non-hidden games
-    # Search games by title, genre, platform, category, or tag
+    # Full-text search over title, tags, categories, platforms, genre and description
     if query:
-        games = Game.objects.filter(
-            Q(title__icontains=query) |
-            Q(genre__icontains=query) |
-            Q(platform__platform_name__icontains=query) |
-            Q(category__category_name__icontains=query) |
-            Q(tags__tag_name__icontains=query)
-        ).distinct()
-
-    if sort == "average_rating":
-        sort_field = "average_rating"
-    else:
-        sort_field = sort
+        games = search_games(games, query)
 
-    if order == "desc":
-        sort_field = f"-{sort_field}"
-    games = games.order_by(sort_field)
+    if sort not in GAME_SORT_FIELDS:
+        sort = 'title'
+    prefix = '-' if order == 'desc' else ''
 
-    # Pagination
-    paginator = Paginator(games, 10)  # 10 games per page
-    page = request.GET.get('page')
-    games_page = paginator.get_page(page)
+    # Pagination, 10 games per page
+    if query and 'sort' not in request.GET:
+        # Without an explicit sort, show the best matches first (ranked results are offset paginated)
+        games_page = paginate(request, games, 10, ('-search_rank', 'id'), allow_cursor=False)
+    else:
+        games_page = paginate(request, games, 10, (f"{prefix}{sort}", f"{prefix}id"))
 
     context = {
         'games': games_page,
@@ -379,10 +494,19 @@ def delete_comment(request, comment_id):
         return HttpResponseForbidden("You don't have permission to delete this comment.")
 
 
+REVIEW_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'helpful': Review.HELPFUL_ORDERING,  # Served by the review_game_helpful_idx index
+}
+
+
 def all_reviews(request, game_id):
     game = get_object_or_404(Game, id=game_id)
-    reviews = game.reviews.order_by('-created_at')
-    return render(request, 'core/all_reviews.html', {'game': game, 'reviews': reviews})
+    sort = request.GET.get('sort', 'newest')
+    if sort not in REVIEW_SORTS:
+        sort = 'newest'
+    reviews = paginate(request, game.reviews.select_related('user'), 10, REVIEW_SORTS[sort])
+    return render(request, 'core/all_reviews.html', {'game': game, 'reviews': reviews, 'sort': sort})
 
 
 @login_required
@@ -421,6 +545,17 @@ def user_list(request):
     return render(request, 'core/user_list.html', context)
 
 
+@login_required
+def request_metrics(request):
+    """
+    Returns the per-view latency and query histograms of this worker process,
+    and how far each read replica is behind the primary.
+    """
+    if request.user.role != 'admin':
+        return HttpResponseForbidden("You are not authorized to access this page.")
+    return JsonResponse({**metrics_snapshot(), 'page_cache': page_cache_stats(), 'replica_lag': replica_lag()})
+
+
 @login_required
 def update_user_role(request, user_id):
     if request.user.role != 'admin':
@@ -465,6 +600,18 @@ def upload_file(request):
     return render(request, 'upload_file.html', {'form': form})
 
 
+@require_safe
+def serve_media(request, path):
+    # Only routed when STORAGE_BACKEND is 'local'
+    try:
+        full_path = default_storage.path(path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+    return media_response(request, full_path)
+
+
 @login_required
 def edit_comment(request, comment_id):
     # Fetch the comment ensuring the current user owns it
@@ -483,21 +630,12 @@ def edit_comment(request, comment_id):
     return render(request, 'core/edit_comment.html', {'form': form, 'comment': comment})
 
 
+@login_required
 def like_comment(request, comment_id):
     comment = get_object_or_404(Comment, id=comment_id)
-    user = request.user
-
-    # Check if the user already liked the comment
-    like, created = Like.objects.get_or_create(user=user, comment=comment)
-    if not created:
-        # If the like already exists, unlike it
-        like.delete()
-        liked = False
-    else:
-        liked = True
 
-    # Return the updated like count
-    like_count = comment.like_set.count()
+    # Like the comment, or unlike it if the user already liked it
+    liked, like_count = toggle_like(request.user, comment)
 
     return JsonResponse({"liked": liked, "like_count": like_count})
 
@@ -514,35 +652,11 @@ def import_steam_comments(request, game_id):
         messages.error(request, "This game does not have a Steam App ID.")
         return redirect('game_detail', game_id=game.id)
 
-    # Ensure steam_user exists or create it
-    steam_user, created = CustomUser.objects.get_or_create(
-        username="steam_user",
-        defaults={"password": "importpassword", "email": "steam@example.com", "role": "user"}
-    )
-
-    # Delete old Steam comments (optional cleanup)
-    Comment.objects.filter(game=game, user=steam_user).delete()
-
-    # Fetch new Steam comments
-    url = f"https://store.steampowered.com/appreviews/{game.steam_app_id}?json=1&filter=recent&language=english"
+    import requests  # Imported on first use to keep worker start fast
 
+    # Fetch Steam reviews page by page; known reviews are updated instead of duplicated
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        reviews = data.get("reviews", [])
-        imported_count = 0
-
-        for review in reviews:
-            content = review.get("review", "")
-            if content:
-                Comment.objects.create(
-                    comment=content,
-                    user=steam_user,
-                    game=game
-                )
-                imported_count += 1
+        imported_count = import_steam_reviews(game, max_pages=settings.STEAM_IMPORT_MAX_PAGES)
 
         if imported_count > 0:
             messages.success(request, f"Successfully imported {imported_count} comments from Steam.")
@@ -586,18 +700,15 @@ def toggle_game_visibility(request, game_id):
 def vote_review(request, review_id, vote_type):
     review = get_object_or_404(Review, id=review_id)
 
-    if review.has_voted(request.user):
-        return HttpResponseForbidden("You have already voted on this review.")
-
-    if vote_type == "up":
-        review.helpful_votes += 1
-    elif vote_type == "down":
-        review.helpful_votes -= 1
+    vote_values = {"up": ReviewVote.UP, "down": ReviewVote.DOWN}
+    if vote_type not in vote_values:
+        return HttpResponseBadRequest("Unknown vote type.")
 
-    review.voters.add(request.user)
-    review.save()
+    # Users may switch their vote, but not cast the same vote twice
+    if not review.cast_vote(request.user, vote_values[vote_type]):
+        return HttpResponseForbidden("You have already voted on this review.")
 
-    return redirect("game_detail", game_id=review.game.id)
+    return redirect("game_detail", game_id=review.game_id)
 
 @login_required
 def edit_review(request, review_id):
@@ -646,7 +757,6 @@ def ban_user(request, user_id):
         messages.error(request, "You cannot ban an admin.")
         return redirect('user_list')
 
-    user.banned = True
-    user.save()
+    ban(user)
     messages.success(request, f"{user.username} has been banned successfully.")
     return redirect('user_list')
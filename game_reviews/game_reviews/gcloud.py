@@ -1,24 +1,106 @@
+import logging
+import os
+import threading
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
 from storages.backends.gcloud import GoogleCloudStorage
 from urllib.parse import urljoin
 from django.conf import settings
 
+from core.instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_BATCH_SIZE = 100  # Requests per batch recommended by Cloud Storage
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process-wide storage client. Clients are thread safe and keep a
+    pooled, authenticated HTTP session, so one is shared by every upload.
+    With STORAGE_EMULATOR_HOST set it talks to a local emulator anonymously.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if os.getenv('STORAGE_EMULATOR_HOST'):
+                _client = storage.Client(project=settings.GS_PROJECT_ID or 'test', credentials=AnonymousCredentials())
+            else:
+                _client = storage.Client(project=settings.GS_PROJECT_ID, credentials=settings.GS_CREDENTIALS)
+        return _client
+
+
+def get_bucket():
+    # Unlike client.get_bucket(), bucket() builds the handle without a metadata request
+    return get_client().bucket(settings.GS_BUCKET_NAME)
+
+
+def upload_file(file, blob_name, content_type):
+    """
+    Streams a file object (e.g. a Django UploadedFile) to the bucket and returns
+    its public URL. Files above 8MB go up as a resumable upload read in
+    GS_UPLOAD_CHUNK_SIZE chunks, so memory use does not grow with the file.
+    The GS_DEFAULT_ACL is set by the upload request itself.
+    """
+    blob = get_bucket().blob(blob_name, chunk_size=settings.GS_UPLOAD_CHUNK_SIZE)
+    file.seek(0)
+    blob.upload_from_file(file, content_type=content_type, size=file.size, predefined_acl=settings.GS_DEFAULT_ACL)
+    return blob.public_url
+
+
+def publish_blobs(blob_names):
+    """
+    Grants public read access to existing blobs, e.g. ones uploaded before
+    GS_DEFAULT_ACL was set. The ACL entries are added through batch requests
+    carrying PUBLISH_BATCH_SIZE objects each, instead of a round trip per blob.
+    Returns the number of blobs published.
+    """
+    client = get_client()
+    bucket = get_bucket()
+    blob_names = list(blob_names)
+    for start in range(0, len(blob_names), PUBLISH_BATCH_SIZE):
+        with client.batch():
+            for blob_name in blob_names[start:start + PUBLISH_BATCH_SIZE]:
+                # blob.make_public() and blob.acl.all().grant_read(); blob.acl.save() reload the
+                # blob's ACL first, and that GET cannot run inside a batch (its response is
+                # deferred). The private _connection.api_request is the only call that just queues
+                # the POST; requirements.txt bounds google-cloud-storage to the major version it
+                # was checked against, since the private API may change without notice.
+                client._connection.api_request(
+                    method='POST', path=f"{bucket.blob(blob_name).path}/acl",
+                    data={'entity': 'allUsers', 'role': 'READER'},
+                )
+    return len(blob_names)
+
 
 class GoogleCloudMediaFileStorage(GoogleCloudStorage):
     """Custom Google Cloud Storage backend that respects GS_LOCATION."""
 
+    @property
+    def client(self):
+        return get_client()
+
     def _save(self, name, content):
         # Ensure the path starts with GS_LOCATION
         if not name.startswith(settings.GS_LOCATION):
             name = f"{settings.GS_LOCATION}/{name.lstrip('/')}"  # Add GS_LOCATION
-        print(f"Uploading file to: {name}")  # Debugging
-        name = super()._save(name, content)
-
-        # Make the file public
-        blob = self.bucket.blob(name)
-        blob.make_public()
-        print(f"File public URL: {blob.public_url}")
+        logger.debug("Uploading file to: %s", name)
+        with timed('storage'):
+            # The upload sets GS_DEFAULT_ACL, no separate request is needed to make it public
+            name = super()._save(name, content)
         return name
 
+    def upload(self, file, name, content_type=None):
+        """
+        Streams a file object to the bucket under name and returns its public URL,
+        which url() leaves as it is.
+        """
+        return upload_file(file, name, content_type)
+
     def url(self, name):
         # Ensure URLs include MEDIA_URL as root
         return urljoin(settings.MEDIA_URL, name.lstrip('/'))
@@ -0,0 +1,36 @@
+import logging
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+from core.instrumentation import timed
+
+logger = logging.getLogger(__name__)
+
+
+class LocalMediaFileStorage(FileSystemStorage):
+    """
+    Filesystem backend laid out like GoogleCloudMediaFileStorage: files are kept
+    under MEDIA_ROOT/GS_LOCATION and served from MEDIA_URL by core.views.serve_media.
+    """
+
+    def _save(self, name, content):
+        # Ensure the path starts with GS_LOCATION
+        if not name.startswith(settings.GS_LOCATION):
+            name = f"{settings.GS_LOCATION}/{name.lstrip('/')}"
+        logger.debug("Saving file to: %s", name)
+        with timed('storage'):
+            return super()._save(name, content)
+
+    def upload(self, file, name, content_type=None):
+        """
+        Stores a file object under name and returns the stored name, which file
+        fields resolve to MEDIA_URL/name. Files are copied in chunks.
+        """
+        file.seek(0)
+        return self.save(name, file)
+
+    def url(self, name):
+        # Ensure URLs include MEDIA_URL as root
+        return urljoin(settings.MEDIA_URL, name.lstrip('/'))
@@ -12,8 +12,9 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 
 import os
 from pathlib import Path
-from decouple import config
-from google.oauth2 import service_account
+from urllib.parse import urlparse
+from decouple import Csv, config
+from django.utils.functional import SimpleLazyObject
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -40,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +58,7 @@ ROOT_URLCONF = 'game_reviews.urls'
 # Templates
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'game_reviews' / 'core' / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -83,6 +86,57 @@ DATABASES = {
     }
 }
 
+# Read Replicas: comma separated host[:port][/name] entries, e.g. "replica1,replica2:5433"
+for index, replica in enumerate(config('DB_REPLICAS', default='', cast=Csv()), start=1):
+    location = urlparse(f"//{replica}")
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': location.hostname,
+        'PORT': location.port or DATABASES['default']['PORT'],
+        'NAME': location.path.lstrip('/') or DATABASES['default']['NAME'],
+        'TEST': {'MIRROR': 'default'},  # Tests read the test database through every alias
+    }
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=5, cast=int)  # Reads stay on the primary after a write
+
+# Cache Configuration (use a shared backend such as Redis in production)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# SteamSpy API
+STEAMSPY_API_URL = config('STEAMSPY_API_URL', default='https://steamspy.com/api.php')
+STEAMSPY_TIMEOUT = config('STEAMSPY_TIMEOUT', default=5, cast=int)
+STEAMSPY_CACHE_TTL = config('STEAMSPY_CACHE_TTL', default=3600, cast=int)  # Seconds an entry stays fresh
+STEAMSPY_NEGATIVE_TTL = config('STEAMSPY_NEGATIVE_TTL', default=300, cast=int)  # Seconds to remember failures
+STEAMSPY_STALE_TTL = config('STEAMSPY_STALE_TTL', default=86400, cast=int)  # Seconds stale data may be served
+
+# Steam store API (review imports)
+STEAM_STORE_URL = config('STEAM_STORE_URL', default='https://store.steampowered.com')
+STEAM_TIMEOUT = config('STEAM_TIMEOUT', default=10, cast=int)
+STEAM_IMPORT_MAX_PAGES = config('STEAM_IMPORT_MAX_PAGES', default=5, cast=int)  # Pages fetched by the admin button
+
+# Ban checks (cached per user id, invalidated when the user is saved). The cache must be shared
+# between workers, or the others keep serving a banned user's requests for up to BAN_CACHE_TTL.
+BAN_CACHE_TTL = config('BAN_CACHE_TTL', default=300, cast=int)  # Seconds a user's ban state is cached
+
+# Full-page cache for anonymous visitors (home, game list, game detail)
+PAGE_CACHE_TTL = config('PAGE_CACHE_TTL', default=300, cast=int)  # Upper bound on how long a page is served
+
+# OCR verification of critics' work IDs
+TESSERACT_CMD = config('TESSERACT_CMD', default='tesseract')  # Path of the Tesseract binary (or a stub)
+OCR_WORKERS = config('OCR_WORKERS', default=2, cast=int)  # Processes in the OCR pool
+
+# Pagination: 'offset' for numbered pages, 'cursor' for keyset pagination on every list
+PAGINATION_MODE = config('PAGINATION_MODE', default='offset')
+
+# Async views: serve game_detail with its async version, for ASGI deployments (game_reviews.asgi)
+ASYNC_GAME_DETAIL = config('ASYNC_GAME_DETAIL', default=False, cast=bool)
+
 # Password Validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -101,29 +155,47 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
-# DEFAULT_FILE_STORAGE = 'storages.backends.gcloud.GoogleCloudStorage'
-DEFAULT_FILE_STORAGE = 'game_reviews.gcloud.GoogleCloudMediaFileStorage'
+# Media Storage: 'gcs' for Google Cloud Storage, 'local' for the filesystem (dev, CI, on-prem)
+STORAGE_BACKEND = config('STORAGE_BACKEND', default='gcs')
 
 GS_FILE_OVERWRITE = False
 
 GS_PROJECT_ID = os.getenv('GS_PROJECT_ID')
 GS_BUCKET_NAME = os.getenv('GS_BUCKET_NAME')
 GS_LOCATION = 'uploads'
+# Predefined ACL sent with every upload; leave empty for buckets with uniform bucket-level access
+GS_DEFAULT_ACL = config('GS_DEFAULT_ACL', default='publicRead', cast=lambda value: value or None)
+GS_UPLOAD_CHUNK_SIZE = config('GS_UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int)  # Multiple of 256KB
+GS_UPLOAD_WORKERS = config('GS_UPLOAD_WORKERS', default=3, cast=int)  # Parallel uploads per saved game
 
-MEDIA_URL = f"https://storage.googleapis.com/{GS_BUCKET_NAME}/{GS_LOCATION}/"
-
-
-MEDIA_ROOT = "media/uploads/"
 UPLOAD_ROOT = 'media/uploads/'
 
-GOOGLE_CREDENTIALS_PATH = 'credentials/google-cloud-credentials.json'
-# Ensure GOOGLE_CREDENTIALS_PATH is properly loaded
-if GOOGLE_CREDENTIALS_PATH:
-    GS_CREDENTIALS = service_account.Credentials.from_service_account_file(
-        os.path.join(BASE_DIR, GOOGLE_CREDENTIALS_PATH)
-    )
+if STORAGE_BACKEND == 'local':
+    # Files live under MEDIA_ROOT/GS_LOCATION and are served by core.views.serve_media
+    DEFAULT_FILE_STORAGE = 'game_reviews.local_storage.LocalMediaFileStorage'
+    MEDIA_URL = '/media/'
+    MEDIA_ROOT = config('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+    GS_CREDENTIALS = None
 else:
-    raise ValueError("GOOGLE_CREDENTIALS_PATH environment variable is not set.")
+    # DEFAULT_FILE_STORAGE = 'storages.backends.gcloud.GoogleCloudStorage'
+    DEFAULT_FILE_STORAGE = 'game_reviews.gcloud.GoogleCloudMediaFileStorage'
+    MEDIA_URL = f"https://storage.googleapis.com/{GS_BUCKET_NAME}/{GS_LOCATION}/"
+    MEDIA_ROOT = "media/uploads/"
+
+    GOOGLE_CREDENTIALS_PATH = 'credentials/google-cloud-credentials.json'
+    # Ensure GOOGLE_CREDENTIALS_PATH is properly loaded
+    if GOOGLE_CREDENTIALS_PATH:
+        def _load_gs_credentials():
+            from google.oauth2 import service_account
+
+            return service_account.Credentials.from_service_account_file(
+                os.path.join(BASE_DIR, GOOGLE_CREDENTIALS_PATH)
+            )
+
+        # Read from disk when the storage client is first created, not on every start
+        GS_CREDENTIALS = SimpleLazyObject(_load_gs_credentials)
+    else:
+        raise ValueError("GOOGLE_CREDENTIALS_PATH environment variable is not set.")
 
 # Default Primary Key Field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'